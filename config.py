@@ -1,51 +1,134 @@
 import os
 import sys
-from typing import List
-
-# Environment variables
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-PORT = int(os.getenv("PORT", "10000"))  # Render uses port 10000 by default
-RENDER_EXTERNAL_URL = os.getenv("RENDER_EXTERNAL_URL")
-ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
-
-# Determine base URL based on environment
-if RENDER_EXTERNAL_URL:
-    BASE_URL = RENDER_EXTERNAL_URL
-else:
-    # Fallback for local development
-    BASE_URL = f"http://localhost:{PORT}"
-
-# Admin IDs from environment
-ADMIN_IDS_STR = os.getenv("ADMIN_IDS", "")
-ADMIN_IDS: List[int] = []
-if ADMIN_IDS_STR:
-    try:
-        ADMIN_IDS = [int(admin_id.strip()) for admin_id in ADMIN_IDS_STR.split(",") if admin_id.strip()]
-    except ValueError:
-        print("[ERROR] Invalid ADMIN_IDS format. Should be comma-separated integers.")
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from typing import FrozenSet, Optional
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Application configuration, read from the environment once at import"""
+    bot_token: Optional[str]
+    port: int
+    render_external_url: Optional[str]
+    environment: str
+    base_url: str
+    admin_ids: FrozenSet[int]
+    webhook_path: str
+    webhook_url: str
+    bot_api_connections: int
+    database_url: str
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_recycle: int
+    db_pool_timeout: int
+    db_pool_pre_ping: bool
+    redis_url: Optional[str]
+
+def _normalize_postgres_url(url: str) -> str:
+    """Convert a PostgreSQL URL for asyncpg; SSL is configured on the engine instead of sslmode"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("postgresql", "postgres"):
+        return url
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query) if key != "sslmode"])
+    return urlunsplit(parts._replace(scheme="postgresql+asyncpg", query=query))
+
+def _load_config() -> Config:
+    """Snapshot the environment and build the configuration"""
+    env = dict(os.environ)
+
+    bot_token = env.get("BOT_TOKEN")
+    port = int(env.get("PORT", "10000"))  # Render uses port 10000 by default
+    render_external_url = env.get("RENDER_EXTERNAL_URL")
+    environment = env.get("ENVIRONMENT", "development")
+
+    # Determine base URL based on environment
+    if render_external_url:
+        base_url = render_external_url
+    else:
+        # Fallback for local development
+        base_url = f"http://localhost:{port}"
+
+    # Admin IDs from environment
+    admin_ids_str = env.get("ADMIN_IDS", "")
+    admin_ids: FrozenSet[int] = frozenset()
+    if admin_ids_str:
+        try:
+            admin_ids = frozenset(
+                int(admin_id.strip()) for admin_id in admin_ids_str.split(",") if admin_id.strip()
+            )
+        except ValueError:
+            print("[ERROR] Invalid ADMIN_IDS format. Should be comma-separated integers.")
+            sys.exit(1)
+
+    # Validation
+    if not bot_token:
+        print("[ERROR] BOT_TOKEN is not set!")
         sys.exit(1)
 
-# Validation
-if not BOT_TOKEN:
-    print("[ERROR] BOT_TOKEN is not set!")
-    sys.exit(1)
-
-# Webhook configuration
-WEBHOOK_PATH = "/webhook"
-WEBHOOK_URL = f"{BASE_URL}{WEBHOOK_PATH}"
-
-# Database configuration
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    # Use SQLite for local development
-    DATABASE_URL = "sqlite+aiosqlite:///corporate_bot.db"
-elif DATABASE_URL.startswith("postgresql://"):
-    # Convert PostgreSQL URL for async support and handle SSL properly
-    DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
-    # Replace sslmode parameter with proper asyncpg format
-    if "?sslmode=require" in DATABASE_URL:
-        DATABASE_URL = DATABASE_URL.replace("?sslmode=require", "")
+    # Webhook configuration
+    webhook_path = "/webhook"
+    webhook_url = f"{base_url}{webhook_path}"
+
+    # Concurrent connections to the Bot API (aiogram's default is 100)
+    bot_api_connections = int(env.get("BOT_API_CONNECTIONS", "100"))
+
+    # Database configuration
+    database_url = env.get("DATABASE_URL")
+    if not database_url:
+        # Use SQLite for local development
+        database_url = "sqlite+aiosqlite:///corporate_bot.db"
+    else:
+        database_url = _normalize_postgres_url(database_url)
+
+    # Database connection pool sizing
+    db_pool_size = int(env.get("DB_POOL_SIZE", "10"))
+    db_max_overflow = int(env.get("DB_MAX_OVERFLOW", "5"))
+    db_pool_recycle = int(env.get("DB_POOL_RECYCLE", "1800"))  # seconds
+    db_pool_timeout = int(env.get("DB_POOL_TIMEOUT", "10"))  # seconds
+    db_pool_pre_ping = env.get("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+
+    # Redis for shared state (optional, in-memory storage is used if not set)
+    redis_url = env.get("REDIS_URL") or None
+
+    return Config(
+        bot_token=bot_token,
+        port=port,
+        render_external_url=render_external_url,
+        environment=environment,
+        base_url=base_url,
+        admin_ids=admin_ids,
+        webhook_path=webhook_path,
+        webhook_url=webhook_url,
+        bot_api_connections=bot_api_connections,
+        database_url=database_url,
+        db_pool_size=db_pool_size,
+        db_max_overflow=db_max_overflow,
+        db_pool_recycle=db_pool_recycle,
+        db_pool_timeout=db_pool_timeout,
+        db_pool_pre_ping=db_pool_pre_ping,
+        redis_url=redis_url
+    )
+
+CONFIG = _load_config()
+
+# Module-level aliases
+BOT_TOKEN = CONFIG.bot_token
+PORT = CONFIG.port
+RENDER_EXTERNAL_URL = CONFIG.render_external_url
+ENVIRONMENT = CONFIG.environment
+BASE_URL = CONFIG.base_url
+ADMIN_IDS: FrozenSet[int] = CONFIG.admin_ids
+WEBHOOK_PATH = CONFIG.webhook_path
+WEBHOOK_URL = CONFIG.webhook_url
+BOT_API_CONNECTIONS = CONFIG.bot_api_connections
+DATABASE_URL = CONFIG.database_url
+DB_POOL_SIZE = CONFIG.db_pool_size
+DB_MAX_OVERFLOW = CONFIG.db_max_overflow
+DB_POOL_RECYCLE = CONFIG.db_pool_recycle
+DB_POOL_TIMEOUT = CONFIG.db_pool_timeout
+DB_POOL_PRE_PING = CONFIG.db_pool_pre_ping
+REDIS_URL = CONFIG.redis_url
 
 print(f"[CONFIG] Using PORT={PORT}, WEBHOOK_URL={WEBHOOK_URL}")
-print(f"[CONFIG] Admin IDs: {ADMIN_IDS}")
+print(f"[CONFIG] Admin IDs: {sorted(ADMIN_IDS)}")
 print(f"[CONFIG] Environment: {ENVIRONMENT}")
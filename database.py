@@ -1,42 +1,195 @@
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from typing import Optional
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import select
-from models import Base, User, Category, Product, TestQuestion, TestResult
-from config import DATABASE_URL
+from sqlalchemy import Float, Integer, String, bindparam, column, func, insert, or_, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload
+from models import Base, User, Category, Product, TestQuestion, TestResult, TestAnswer
+from config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, DB_POOL_PRE_PING, REDIS_URL
+)
+from utils.cache import async_ttl_cache
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Shared Redis client (optional, only created when REDIS_URL is set)
+if REDIS_URL:
+    from redis.asyncio import Redis
+    redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
+else:
+    redis_client = None
+
 # Create async engine with proper configuration
 if DATABASE_URL.startswith("postgresql"):
     # For PostgreSQL with asyncpg, handle SSL properly
     engine = create_async_engine(
         DATABASE_URL,
         echo=False,
-        pool_pre_ping=True,
-        connect_args={"ssl": "require"}
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        # Fail fast instead of queueing updates behind an exhausted pool
+        pool_timeout=DB_POOL_TIMEOUT,
+        # Recycling covers stale connections; a ping per checkout is opt-in
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_reset_on_return="rollback",
+        query_cache_size=1200,
+        connect_args={
+            "ssl": "require",
+            # Prepared statements kept per connection so repeated queries skip parse/plan
+            "prepared_statement_cache_size": 256
+        }
     )
 else:
     # For SQLite
     engine = create_async_engine(
         DATABASE_URL,
         echo=False,
-        pool_pre_ping=True
+        query_cache_size=1200
     )
 
+# INSERT ... ON CONFLICT for the current dialect
+_dialect_insert = postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
+
 # Create async session factory
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
+# Product search indexes over name and description, created per dialect at startup
+_POSTGRES_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_description_trgm ON products USING gin (description gin_trgm_ops)",
+)
+
+_SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, description, content='products', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ai AFTER INSERT ON products BEGIN "
+    "INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_ad AFTER DELETE ON products BEGIN "
+    "INSERT INTO product_search(product_search, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS product_search_au AFTER UPDATE OF name, description ON products BEGIN "
+    "INSERT INTO product_search(product_search, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO product_search(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "INSERT INTO product_search(product_search) VALUES ('rebuild')",
+)
+
+_SEARCH_MATCH_SQL = text(
+    "SELECT rowid, rank FROM product_search WHERE product_search MATCH :match"
+).columns(column("rowid", Integer), column("rank", Float))
+
+# The trigram tokenizer needs at least three characters to match
+_FTS_MIN_QUERY_LENGTH = 3
+
+# Search results are shown as one button each
+SEARCH_RESULTS_LIMIT = 50
+
+_fts_ready = False
+# Set once pg_trgm is available, so similarity() can be used for ranking
+_trgm_ready = False
+
+# Admin statistics are recomputed in the background instead of per request
+STATS_REFRESH_INTERVAL = 60  # seconds
+_stats_cache: Optional[dict] = None
+_stats_cached_at = 0.0
+
+# Categories and test questions change rarely, so reads are cached in process
+CATEGORIES_CACHE_TTL = 300  # seconds
+CATEGORIES_VERSION_KEY = "categories:version"
+QUESTIONS_CACHE_TTL = 300  # seconds
+TEST_PRODUCTS_CACHE_TTL = 60  # seconds
+PRODUCT_CACHE_TTL = 300  # seconds
+
+# Individual test answers are written behind the handlers in batches
+ANSWER_BATCH_SIZE = 50
+_answer_queue: "asyncio.Queue[dict]" = asyncio.Queue()
+
+# SQL statements, built once at import so their compiled form is cached
+_TEST_PRODUCTS_SQL = text("""
+    SELECT p.id, p.name, COUNT(tq.id) as question_count
+    FROM products p 
+    INNER JOIN test_questions tq ON p.id = tq.product_id
+    WHERE p.category_id = :category_id
+    GROUP BY p.id, p.name
+    ORDER BY p.name
+""").columns(
+    column("id", Integer),
+    column("name", String),
+    column("question_count", Integer)
+)
+
+_PRODUCT_DETAILS_SQL = text("""
+    SELECT p.id, p.name, p.description, p.image_file_id, p.document_file_id, 
+           c.name as category_name, c.id as category_id,
+           (SELECT COUNT(*) FROM test_questions tq WHERE tq.product_id = p.id) as question_count
+    FROM products p 
+    LEFT JOIN categories c ON p.category_id = c.id 
+    WHERE p.id = :product_id
+""").bindparams(bindparam("product_id", type_=Integer))
+
+# Merge categories sharing a name into the oldest one, so the unique index on
+# categories.name can be created on databases from before it existed
+_DEDUPE_CATEGORIES_SQL = (
+    """
+    UPDATE products SET category_id = (
+        SELECT MIN(keep.id) FROM categories dup
+        JOIN categories keep ON keep.name = dup.name
+        WHERE dup.id = products.category_id
+    )
+    WHERE category_id IN (
+        SELECT c.id FROM categories c
+        WHERE EXISTS (SELECT 1 FROM categories d WHERE d.name = c.name AND d.id < c.id)
+    )
+    """,
+    """
+    DELETE FROM categories
+    WHERE EXISTS (SELECT 1 FROM categories d WHERE d.name = categories.name AND d.id < categories.id)
+    """,
+)
+
+def _create_missing_indexes(sync_conn):
+    """Create indexes added to the models after their tables already existed"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 async def init_database():
     """Initialize database and create all tables"""
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            for statement in _DEDUPE_CATEGORIES_SQL:
+                await conn.execute(text(statement))
+            await conn.run_sync(_create_missing_indexes)
         logger.info("Database initialized successfully")
     except Exception as e:
-        logger.error(f"Error initializing database: {e}")
+        logger.error("Error initializing database: %s", e)
         raise
+    
+    await init_search_index()
+
+async def init_search_index():
+    """Create the product search index for the current database dialect"""
+    global _fts_ready, _trgm_ready
+    is_postgres = engine.dialect.name == "postgresql"
+    statements = _POSTGRES_SEARCH_DDL if is_postgres else _SQLITE_SEARCH_DDL
+    try:
+        async with engine.begin() as conn:
+            for statement in statements:
+                await conn.execute(text(statement))
+        _fts_ready = not is_postgres
+        _trgm_ready = is_postgres
+        logger.info("Product search index initialized")
+    except Exception as e:
+        # Search still works without the index, just with a full scan
+        logger.warning("Could not create product search index: %s", e)
 
 async def get_session():
     """Get async database session"""
@@ -46,6 +199,15 @@ async def get_session():
         finally:
             await session.close()
 
+@asynccontextmanager
+async def _session_scope(session: Optional[AsyncSession] = None):
+    """Use the given session, or open a short-lived one if there is none"""
+    if session is not None:
+        yield session
+    else:
+        async with AsyncSessionLocal() as new_session:
+            yield new_session
+
 class DatabaseManager:
     """Database manager for common operations"""
     
@@ -53,68 +215,165 @@ class DatabaseManager:
     AsyncSessionLocal = AsyncSessionLocal
     
     @staticmethod
-    async def get_or_create_user(telegram_id: int, username: Optional[str] = None, 
-                               first_name: Optional[str] = None, last_name: Optional[str] = None, 
-                               is_admin: bool = False):
-        """Get existing user or create new one"""
+    async def _ping():
+        """Run a trivial query to open a pooled connection"""
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    @staticmethod
+    async def warm_pool(connections: int = 5):
+        """Open several pool connections up front so first requests skip connect/TLS setup"""
+        await asyncio.gather(*(DatabaseManager._ping() for _ in range(connections)))
+    
+    @staticmethod
+    async def get_stats() -> dict:
+        """Count rows in the main tables in a single round trip"""
         async with AsyncSessionLocal() as session:
-            # Try to get existing user
             result = await session.execute(
-                select(User).where(User.telegram_id == telegram_id)
+                text("""
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS users,
+                    (SELECT COUNT(*) FROM categories) AS categories,
+                    (SELECT COUNT(*) FROM products) AS products,
+                    (SELECT COUNT(*) FROM test_questions) AS questions,
+                    (SELECT COUNT(*) FROM test_results) AS test_results
+                """)
             )
-            user = result.scalar_one_or_none()
-            
-            if user:
-                # Update last activity and other fields
-                user.last_activity = datetime.utcnow()
-                if username:
-                    user.username = username
-                if first_name:
-                    user.first_name = first_name
-                if last_name:
-                    user.last_name = last_name
-                await session.commit()
-                return user
-            else:
-                # Create new user
-                user = User(
-                    telegram_id=telegram_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    is_admin=is_admin
-                )
-                session.add(user)
-                await session.commit()
-                await session.refresh(user)
-                return user
+            return dict(result.mappings().one())
+    
+    @staticmethod
+    async def get_cached_stats() -> dict:
+        """Get statistics from the background cache, computing them if it is missing or stale"""
+        global _stats_cache, _stats_cached_at
+        if _stats_cache is None or time.monotonic() - _stats_cached_at > 2 * STATS_REFRESH_INTERVAL:
+            _stats_cache = await DatabaseManager.get_stats()
+            _stats_cached_at = time.monotonic()
+        return _stats_cache
+    
+    @staticmethod
+    def invalidate_stats():
+        """Drop the cached statistics so the next read recomputes them"""
+        global _stats_cache
+        _stats_cache = None
+    
+    @staticmethod
+    async def get_or_create_user(telegram_id: int, username: Optional[str] = None, 
+                               first_name: Optional[str] = None, last_name: Optional[str] = None, 
+                               is_admin: bool = False, session: Optional[AsyncSession] = None):
+        """Get existing user or create new one in a single upsert"""
+        now = datetime.utcnow()
+        insert_stmt = _dialect_insert(User).values(
+            telegram_id=telegram_id,
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            is_admin=is_admin,
+            last_activity=now
+        )
+        # Existing users get their last activity bumped; names are only overwritten when provided
+        stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={
+                'last_activity': now,
+                'username': func.coalesce(insert_stmt.excluded.username, User.username),
+                'first_name': func.coalesce(insert_stmt.excluded.first_name, User.first_name),
+                'last_name': func.coalesce(insert_stmt.excluded.last_name, User.last_name)
+            }
+        ).returning(User)
+        
+        async with _session_scope(session) as session:
+            result = await session.execute(stmt, execution_options={"populate_existing": True})
+            user = result.scalar_one()
+            await session.commit()
+            return user
+    
+    @staticmethod
+    @async_ttl_cache(ttl=CATEGORIES_CACHE_TTL, maxsize=2)
+    async def _load_categories(version: int):
+        """Load all categories as (id, name, description) rows for a cache version"""
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(Category.id, Category.name, Category.description).order_by(Category.name)
+            )
+            return result.all()
+    
+    @staticmethod
+    @async_ttl_cache(ttl=CATEGORIES_CACHE_TTL, maxsize=2)
+    async def _load_categories_by_id(version: int):
+        """Index the cached categories of a cache version by id"""
+        return {category.id: category for category in await DatabaseManager._load_categories(version)}
+    
+    @staticmethod
+    async def _categories_version() -> int:
+        """Current categories cache version, shared through Redis when configured"""
+        if not redis_client:
+            return 0
+        try:
+            # Other processes bump the version when they change categories
+            return int(await redis_client.get(CATEGORIES_VERSION_KEY) or 0)
+        except Exception as e:
+            logger.warning("Failed to read categories cache version: %s", e)
+            return 0
     
     @staticmethod
     async def get_categories():
-        """Get all categories"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Category).order_by(Category.name))
-            return result.scalars().all()
+        """Get all categories, cached until the TTL expires or categories change"""
+        version = await DatabaseManager._categories_version()
+        return await DatabaseManager._load_categories(version)
     
     @staticmethod
-    async def get_products_by_category(category_id: int):
-        """Get products by category"""
-        async with AsyncSessionLocal() as session:
+    async def invalidate_categories():
+        """Drop cached categories in this and, with Redis, every other process"""
+        DatabaseManager._load_categories.cache_clear()
+        DatabaseManager._load_categories_by_id.cache_clear()
+        if redis_client:
+            try:
+                await redis_client.incr(CATEGORIES_VERSION_KEY)
+            except Exception as e:
+                logger.warning("Failed to bump categories cache version: %s", e)
+    
+    @staticmethod
+    async def get_category_by_id(category_id: int):
+        """Get a single category as an (id, name, description) row from the categories cache"""
+        version = await DatabaseManager._categories_version()
+        categories = await DatabaseManager._load_categories_by_id(version)
+        return categories.get(category_id)
+    
+    @staticmethod
+    async def get_products_by_category(category_id: int, session: Optional[AsyncSession] = None):
+        """Get products of a category as (id, name) rows"""
+        async with _session_scope(session) as session:
             result = await session.execute(
-                select(Product).where(Product.category_id == category_id).order_by(Product.name)
+                select(Product.id, Product.name).where(Product.category_id == category_id).order_by(Product.name)
             )
-            return result.scalars().all()
+            return result.all()
     
     @staticmethod
-    async def search_products(query: str):
-        """Search products by name"""
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Product).where(Product.name.ilike(f"%{query}%")).order_by(Product.name)
+    async def search_products(query: str, session: Optional[AsyncSession] = None):
+        """Search products by name and description as (id, name) rows, best matches first"""
+        if _fts_ready and len(query) >= _FTS_MIN_QUERY_LENGTH:
+            # SQLite: rank matches from the trigram FTS table
+            matches = _SEARCH_MATCH_SQL.bindparams(match='"' + query.replace('"', '""') + '"').subquery()
+            stmt = (
+                select(Product.id, Product.name)
+                .join(matches, Product.id == matches.c.rowid)
+                .order_by(matches.c.rank)
             )
-            return result.scalars().all()
+        else:
+            # PostgreSQL serves this from the pg_trgm indexes when they could be created
+            pattern = f"%{query}%"
+            stmt = select(Product.id, Product.name).where(or_(Product.name.ilike(pattern), Product.description.ilike(pattern)))
+            if _trgm_ready:
+                stmt = stmt.order_by(func.similarity(Product.name, query).desc(), Product.name)
+            else:
+                stmt = stmt.order_by(Product.name)
+        
+        async with _session_scope(session) as session:
+            result = await session.execute(stmt.limit(SEARCH_RESULTS_LIMIT))
+            return result.all()
     
     @staticmethod
+    @async_ttl_cache(ttl=QUESTIONS_CACHE_TTL, maxsize=256)
     async def get_test_questions(product_id: int):
         """Get test questions for a product"""
         async with AsyncSessionLocal() as session:
@@ -123,11 +382,65 @@ class DatabaseManager:
             )
             return result.scalars().all()
     
+    @staticmethod
+    @async_ttl_cache(ttl=QUESTIONS_CACHE_TTL, maxsize=256)
+    async def _test_questions_by_id(product_id: int):
+        """Index the cached test questions of a product by id"""
+        return {question.id: question for question in await DatabaseManager.get_test_questions(product_id)}
+    
+    @staticmethod
+    async def get_test_question(product_id: int, question_id: int):
+        """Get one test question of a product from the questions cache"""
+        questions = await DatabaseManager._test_questions_by_id(product_id)
+        return questions.get(question_id)
+    
+    @staticmethod
+    @async_ttl_cache(ttl=TEST_PRODUCTS_CACHE_TTL, maxsize=256)
+    async def get_test_products(category_id: int):
+        """Get products of a category that have test questions, with question counts"""
+        async with engine.connect() as conn:
+            result = await conn.execute(_TEST_PRODUCTS_SQL, {"category_id": category_id})
+            return result.all()
+    
+    @staticmethod
+    @async_ttl_cache(ttl=PRODUCT_CACHE_TTL, maxsize=512)
+    async def get_product_details(product_id: int):
+        """Get a product with its category name and test question count"""
+        async with engine.connect() as conn:
+            result = await conn.execute(_PRODUCT_DETAILS_SQL, {"product_id": product_id})
+            return result.one_or_none()
+    
+    @staticmethod
+    async def get_user_results(user_id: int, limit: int = 10, session: Optional[AsyncSession] = None):
+        """Get latest test results of a user with their products loaded in the same query"""
+        async with _session_scope(session) as session:
+            result = await session.execute(
+                select(TestResult)
+                .options(joinedload(TestResult.product))
+                .where(TestResult.user_id == user_id)
+                .order_by(TestResult.completed_at.desc())
+                .limit(limit)
+            )
+            return result.scalars().all()
+    
+    @staticmethod
+    def queue_test_answer(user_id: int, product_id: int, question_id: int, answer: str, is_correct: bool):
+        """Queue a test answer to be saved by the write-behind task"""
+        _answer_queue.put_nowait({
+            'user_id': user_id,
+            'product_id': product_id,
+            'question_id': question_id,
+            'answer': answer,
+            'is_correct': is_correct,
+            'answered_at': datetime.utcnow()
+        })
+    
     @staticmethod
     async def save_test_result(user_id: int, product_id: int, score: float, 
-                             total_questions: int, correct_answers: int):
+                             total_questions: int, correct_answers: int,
+                             session: Optional[AsyncSession] = None):
         """Save test result"""
-        async with AsyncSessionLocal() as session:
+        async with _session_scope(session) as session:
             test_result = TestResult(
                 user_id=user_id,
                 product_id=product_id,
@@ -138,3 +451,60 @@ class DatabaseManager:
             session.add(test_result)
             await session.commit()
             return test_result
+
+async def refresh_stats_cache(interval: int = STATS_REFRESH_INTERVAL):
+    """Background task keeping the admin statistics cache fresh"""
+    global _stats_cache, _stats_cached_at
+    while True:
+        try:
+            _stats_cache = await DatabaseManager.get_stats()
+            _stats_cached_at = time.monotonic()
+        except Exception as e:
+            logger.error("Error refreshing stats cache: %s", e)
+        await asyncio.sleep(interval)
+
+async def _insert_rows(model, rows: list):
+    """Insert rows in a single transaction"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(model), rows)
+        await session.commit()
+
+async def _save_rows(model, rows: list):
+    """Insert a batch of queued rows, falling back to one row at a time if the batch fails"""
+    try:
+        await _insert_rows(model, rows)
+        return
+    except Exception as e:
+        if len(rows) == 1:
+            logger.error("Error saving %s row %s: %s", model.__tablename__, rows[0], e)
+            return
+        logger.warning("Error saving %s %s rows, retrying one by one: %s", len(rows), model.__tablename__, e)
+    
+    # Only the rows that fail on their own are lost
+    for row in rows:
+        try:
+            await _insert_rows(model, [row])
+        except Exception as e:
+            logger.error("Error saving %s row %s: %s", model.__tablename__, row, e)
+
+async def _write_behind(queue: "asyncio.Queue[dict]", model, batch_size: int):
+    """Drain a queue of rows to the database in batches until cancelled"""
+    rows = []
+    try:
+        while True:
+            rows = [await queue.get()]
+            while len(rows) < batch_size and not queue.empty():
+                rows.append(queue.get_nowait())
+            await _save_rows(model, rows)
+            rows = []
+    except asyncio.CancelledError:
+        # Flush the batch in flight and whatever is still queued before shutting down
+        while not queue.empty():
+            rows.append(queue.get_nowait())
+        if rows:
+            await _save_rows(model, rows)
+        raise
+
+async def write_test_answers(batch_size: int = ANSWER_BATCH_SIZE):
+    """Background task draining queued test answers to the database in batches"""
+    await _write_behind(_answer_queue, TestAnswer, batch_size)
@@ -1,7 +1,13 @@
+import html
 import logging
-from aiogram import Router, types
+from dataclasses import asdict, dataclass
+from typing import Final, Optional
+from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import DatabaseManager
 from utils.keyboards import Keyboards
 from utils.helpers import MessageHelper, ValidationHelper
@@ -10,6 +16,120 @@ from middleware.auth import admin_required
 router = Router()
 logger = logging.getLogger(__name__)
 
+_ADMIN_PANEL_TEXT: Final = (
+    "⚙️ <b>Панель администратора</b>\n\n"
+    "Добро пожаловать в панель управления. Выберите опцию:"
+)
+
+_ADD_CATEGORY_TEXT: Final = (
+    "➕ <b>Добавить новую категорию</b>\n\n"
+    "📝 Введите название категории:\n\n"
+    "Требования:\n"
+    "• 2-100 символов\n"
+    "• Описательное и понятное"
+)
+
+_CATEGORY_DESCRIPTION_PROMPT_TEMPLATE: Final = (
+    "📝 <b>Название категории:</b> {name}\n\n"
+    "📄 Введите описание для этой категории (необязательно):\n\n"
+    "Можете отправить 'пропустить' чтобы продолжить без описания."
+)
+
+_CATEGORY_CREATED_TEMPLATE: Final = (
+    "✅ <b>Категория создана успешно!</b>\n\n"
+    "📁 Название: {name}\n"
+    "{description}"
+    "\nТеперь вы можете добавить продукты в эту категорию."
+)
+
+_CATEGORY_DESCRIPTION_LINE_TEMPLATE: Final = "📄 Описание: {description}\n"
+
+# SQL statements, built once at import
+_INSERT_CATEGORY_SQL: Final = text("""
+    INSERT INTO categories (name, description, created_by)
+    VALUES (:name, :description, :created_by)
+    ON CONFLICT (name) DO NOTHING
+    RETURNING id
+""")
+
+_CATEGORIES_WITH_PRODUCT_COUNT_SQL: Final = text("""
+    SELECT c.id, c.name, COUNT(p.id) as product_count
+    FROM categories c 
+    LEFT JOIN products p ON p.category_id = c.id 
+    GROUP BY c.id, c.name
+    ORDER BY c.name
+""")
+
+_PRODUCT_COUNT_SQL: Final = text("SELECT COUNT(*) FROM products")
+
+_PRODUCTS_WITH_CATEGORY_SQL: Final = text("""
+    SELECT p.id, p.name, c.name as category_name 
+    FROM products p 
+    LEFT JOIN categories c ON p.category_id = c.id 
+    ORDER BY c.name, p.name
+    LIMIT :limit OFFSET :offset
+""")
+
+_PRODUCTS_WITH_QUESTION_COUNT_SQL: Final = text("""
+    SELECT p.id, p.name, c.name as category_name, COUNT(tq.id) as question_count
+    FROM products p 
+    LEFT JOIN categories c ON p.category_id = c.id 
+    LEFT JOIN test_questions tq ON p.id = tq.product_id
+    GROUP BY p.id, p.name, c.name
+    ORDER BY c.name, p.name
+    LIMIT :limit OFFSET :offset
+""")
+
+# Products shown per page in the admin products and questions lists
+_ADMIN_PAGE_SIZE: Final = 10
+
+# Static buttons and keyboards shared across requests
+_ADD_CATEGORY_BUTTON: Final = types.InlineKeyboardButton(
+    text="➕ Добавить категорию",
+    callback_data="add_category"
+)
+
+_ADD_PRODUCT_BUTTON: Final = types.InlineKeyboardButton(
+    text="➕ Добавить продукт",
+    callback_data="select_category_for_product"
+)
+
+_BACK_TO_ADMIN_BUTTON: Final = types.InlineKeyboardButton(
+    text="🔙 К панели администратора",
+    callback_data="admin_panel"
+)
+
+_BACK_TO_ADMIN_MARKUP: Final = InlineKeyboardBuilder().row(_BACK_TO_ADMIN_BUTTON).as_markup()
+
+_ADMIN_PANEL_MARKUP: Final = Keyboards.admin_panel()
+
+@dataclass(slots=True)
+class CategoryDraft:
+    """Category collected across the add-category steps"""
+    name: str
+    description: Optional[str] = None
+
+def _page_params(data: str) -> dict:
+    """Get LIMIT/OFFSET parameters from "prefix" or "prefix:offset" callback data"""
+    offset = max(int(data.partition(":")[2] or 0), 0)
+    # One extra row tells whether there is a next page
+    return {"limit": _ADMIN_PAGE_SIZE + 1, "offset": offset}
+
+def _page_nav_row(prefix: str, offset: int, has_next: bool) -> list:
+    """Previous/next buttons for a paginated admin list"""
+    row = []
+    if offset > 0:
+        row.append(types.InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=f"{prefix}:{max(offset - _ADMIN_PAGE_SIZE, 0)}"
+        ))
+    if has_next:
+        row.append(types.InlineKeyboardButton(
+            text="Далее ➡️",
+            callback_data=f"{prefix}:{offset + _ADMIN_PAGE_SIZE}"
+        ))
+    return row
+
 class AdminStates(StatesGroup):
     waiting_for_category_name = State()
     waiting_for_category_description = State()
@@ -23,95 +143,56 @@ class AdminStates(StatesGroup):
     waiting_for_option_d = State()
     waiting_for_correct_answer = State()
 
-@router.callback_query(lambda c: c.data == "admin_panel")
+@router.callback_query(F.data == "admin_panel")
 @admin_required
 async def admin_panel_handler(query: types.CallbackQuery, **kwargs):
     """Handle admin panel menu"""
-    text = (
-        "⚙️ **Панель администратора**\n\n"
-        "Добро пожаловать в панель управления. Выберите опцию:"
-    )
-    
     await MessageHelper.safe_edit_message(
         query,
-        text=text,
-        reply_markup=Keyboards.admin_panel(),
-        parse_mode="Markdown"
+        text=_ADMIN_PANEL_TEXT,
+        reply_markup=_ADMIN_PANEL_MARKUP,
+        parse_mode="HTML"
     )
 
-@router.callback_query(lambda c: c.data == "admin_categories")
+@router.callback_query(F.data == "admin_categories")
 @admin_required
-async def admin_categories_handler(query: types.CallbackQuery, **kwargs):
+async def admin_categories_handler(query: types.CallbackQuery, db_session: AsyncSession, **kwargs):
     """Handle admin categories management"""
-    try:
-        categories = await DatabaseManager.get_categories()
-        
-        text = (
-            "📁 **Управление категориями**\n\n"
-            f"Всего категорий: {len(categories)}\n\n"
-        )
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        
-        if categories:
-            text += "Выберите категорию для управления:"
-            for category in categories:
-                builder.row(
-                    types.InlineKeyboardButton(
-                        text=f"📁 {category.name}",
-                        callback_data=f"admin_view_category:{category.id}"
-                    )
-                )
-        else:
-            text += "Категории недоступны."
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="➕ Добавить категорию",
-                callback_data="add_category"
-            )
-        )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔙 К панели администратора",
-                callback_data="admin_panel"
-            )
-        )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in admin_categories_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки категорий. Попробуйте снова.", 
-            show_alert=True
-        )
+    # Get all categories with product counts
+    result = await db_session.execute(_CATEGORIES_WITH_PRODUCT_COUNT_SQL)
+    categories = result.mappings().all()
+    
+    text = (
+        "📁 <b>Управление категориями</b>\n\n"
+        f"Всего категорий: {len(categories)}\n\n"
+    )
+    
+    if categories:
+        text += "Выберите категорию для управления:"
+    else:
+        text += "Категории недоступны."
+    
+    rows = [
+        [types.InlineKeyboardButton(
+            text=f"📁 {category['name']} ({category['product_count']})",
+            callback_data=f"admin_view_category:{category['id']}"
+        )]
+        for category in categories
+    ]
+    rows.append([_ADD_CATEGORY_BUTTON])
+    rows.append([_BACK_TO_ADMIN_BUTTON])
+    
+    await MessageHelper.render_menu(query, text, rows, parse_mode="HTML")
 
-@router.callback_query(lambda c: c.data == "add_category")
+@router.callback_query(F.data == "add_category")
 @admin_required
 async def add_category_handler(query: types.CallbackQuery, state: FSMContext, **kwargs):
     """Handle add category"""
-    text = (
-        "➕ **Добавить новую категорию**\n\n"
-        "📝 Введите название категории:\n\n"
-        "Требования:\n"
-        "• 2-100 символов\n"
-        "• Описательное и понятное"
-    )
-    
     await MessageHelper.safe_edit_message(
         query,
-        text=text,
+        text=_ADD_CATEGORY_TEXT,
         reply_markup=None,
-        parse_mode="Markdown"
+        parse_mode="HTML"
     )
     
     await state.set_state(AdminStates.waiting_for_category_name)
@@ -121,7 +202,7 @@ async def add_category_handler(query: types.CallbackQuery, state: FSMContext, **
 async def process_category_name(message: types.Message, state: FSMContext, user=None, **kwargs):
     """Process category name input"""
     try:
-        category_name = message.text.strip() if message.text else ""
+        category_name = ValidationHelper.normalize_input(message.text)
         
         if not ValidationHelper.is_valid_category_name(category_name):
             await message.answer(
@@ -129,43 +210,25 @@ async def process_category_name(message: types.Message, state: FSMContext, user=
             )
             return
         
-        # Check if category already exists
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            result = await session.execute(
-                text("SELECT id FROM categories WHERE name = :name"),
-                {"name": category_name}
-            )
-            existing = result.fetchone()
+        # FSM storages serialize data to JSON, so the draft is stored as a dict
+        await state.update_data(category_draft=asdict(CategoryDraft(name=category_name)))
         
-        if existing:
-            await message.answer(
-                "⚠️ Категория с таким названием уже существует. Выберите другое название."
-            )
-            return
-        
-        await state.update_data(category_name=category_name)
-        
-        text = (
-            f"📝 **Название категории:** {category_name}\n\n"
-            "📄 Введите описание для этой категории (необязательно):\n\n"
-            "Можете отправить 'пропустить' чтобы продолжить без описания."
-        )
+        text = _CATEGORY_DESCRIPTION_PROMPT_TEMPLATE.format(name=html.escape(category_name))
         
-        await message.answer(text, parse_mode="Markdown")
+        await message.answer(text, parse_mode="HTML")
         await state.set_state(AdminStates.waiting_for_category_description)
         
     except Exception as e:
-        logger.error(f"Error in process_category_name: {e}")
+        logger.error("Error in process_category_name: %s", e)
         await message.answer("❌ Ошибка обработки названия категории. Попробуйте снова.")
         await state.clear()
 
 @router.message(AdminStates.waiting_for_category_description)
 @admin_required
-async def process_category_description(message: types.Message, state: FSMContext, user=None, **kwargs):
+async def process_category_description(message: types.Message, state: FSMContext, db_session: AsyncSession, user=None, **kwargs):
     """Process category description input"""
     try:
-        description = message.text.strip() if message.text else ""
+        description = ValidationHelper.normalize_input(message.text)
         
         if description.lower() == 'пропустить':
             description = None
@@ -176,284 +239,185 @@ async def process_category_description(message: types.Message, state: FSMContext
             return
         
         state_data = await state.get_data()
-        category_name = state_data.get('category_name')
+        draft = CategoryDraft(**state_data['category_draft'])
+        draft.description = description
         
-        # Create category
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            await session.execute(
-                text("INSERT INTO categories (name, description, created_by) VALUES (:name, :description, :created_by)"),
-                {"name": category_name, "description": description, "created_by": user.telegram_id}
+        # Create category, relying on the unique name index to reject duplicates
+        result = await db_session.execute(
+            _INSERT_CATEGORY_SQL,
+            {"name": draft.name, "description": draft.description, "created_by": user.telegram_id}
+        )
+        created = result.fetchone()
+        await db_session.commit()
+        
+        if not created:
+            await message.answer(
+                "⚠️ Категория с таким названием уже существует. Введите другое название."
             )
-            await session.commit()
+            await state.set_state(AdminStates.waiting_for_category_name)
+            return
         
+        await DatabaseManager.invalidate_categories()
+        DatabaseManager.invalidate_stats()
         await state.clear()
         
-        text = (
-            "✅ **Категория создана успешно!**\n\n"
-            f"📁 Название: {category_name}\n"
+        text = _CATEGORY_CREATED_TEMPLATE.format(
+            name=html.escape(draft.name),
+            description=_CATEGORY_DESCRIPTION_LINE_TEMPLATE.format(
+                description=html.escape(draft.description)
+            ) if draft.description else ""
         )
         
-        if description:
-            text += f"📄 Описание: {description}\n"
-        
-        text += "\nТеперь вы можете добавить продукты в эту категорию."
-        
         await message.answer(
             text,
-            reply_markup=Keyboards.admin_panel(),
-            parse_mode="Markdown"
+            reply_markup=_ADMIN_PANEL_MARKUP,
+            parse_mode="HTML"
         )
         
     except Exception as e:
-        logger.error(f"Error in process_category_description: {e}")
+        logger.error("Error in process_category_description: %s", e)
         await message.answer("❌ Ошибка создания категории. Попробуйте снова.")
         await state.clear()
 
-@router.callback_query(lambda c: c.data == "admin_products")
+@router.callback_query(F.data == "admin_products")
+@router.callback_query(F.data.startswith("admin_products:"))
 @admin_required
-async def admin_products_handler(query: types.CallbackQuery, **kwargs):
+async def admin_products_handler(query: types.CallbackQuery, db_session: AsyncSession, **kwargs):
     """Handle admin products management"""
-    try:
-        # Get all products with category names
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            result = await session.execute(
-                text("""
-                SELECT p.id, p.name, c.name as category_name 
-                FROM products p 
-                LEFT JOIN categories c ON p.category_id = c.id 
-                ORDER BY c.name, p.name
-                """)
-            )
-            products = result.fetchall()
-        
-        text = (
-            "📦 **Управление продуктами**\n\n"
-            f"Всего продуктов: {len(products)}\n\n"
-        )
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
+    # Get one page of products with category names
+    params = _page_params(query.data)
+    result = await db_session.execute(_PRODUCTS_WITH_CATEGORY_SQL, params)
+    products = result.fetchall()
+    has_next = len(products) > _ADMIN_PAGE_SIZE
+    products = products[:_ADMIN_PAGE_SIZE]
+    
+    # Counted directly so the total reflects the admin's own changes right away
+    total_products = await db_session.scalar(_PRODUCT_COUNT_SQL)
+    
+    text = (
+        "📦 <b>Управление продуктами</b>\n\n"
+        f"Всего продуктов: {total_products}\n\n"
+    )
+    
+    rows = []
+    
+    if products:
+        text += "Выберите продукт для управления:"
         
-        if products:
-            text += "Выберите продукт для управления:"
-            
-            for product in products[:10]:  # Limit to 10 for keyboard space
-                display_name = f"{product.name}"
-                if product.category_name:
-                    display_name += f" ({product.category_name})"
-                
-                builder.row(
-                    types.InlineKeyboardButton(
-                        text=f"📦 {display_name}",
-                        callback_data=f"admin_view_product:{product.id}"
-                    )
-                )
+        for product in products:
+            display_name = f"{product.name}"
+            if product.category_name:
+                display_name += f" ({product.category_name})"
             
-            if len(products) > 10:
-                text += f"\n\n(Показано первые 10 из {len(products)} продуктов)"
-        else:
-            text += "Продукты недоступны."
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="➕ Добавить продукт",
-                callback_data="select_category_for_product"
-            )
-        )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔙 К панели администратора",
-                callback_data="admin_panel"
-            )
-        )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in admin_products_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки продуктов. Попробуйте снова.", 
-            show_alert=True
-        )
+            rows.append([types.InlineKeyboardButton(
+                text=f"📦 {display_name}",
+                callback_data=f"admin_view_product:{product.id}"
+            )])
+        
+        nav_row = _page_nav_row("admin_products", params["offset"], has_next)
+        if nav_row:
+            rows.append(nav_row)
+    else:
+        text += "Продукты недоступны."
+    
+    rows.append([_ADD_PRODUCT_BUTTON])
+    rows.append([_BACK_TO_ADMIN_BUTTON])
+    
+    await MessageHelper.render_menu(query, text, rows, parse_mode="HTML")
 
-@router.callback_query(lambda c: c.data == "select_category_for_product")
+@router.callback_query(F.data == "select_category_for_product")
 @admin_required
 async def select_category_for_product(query: types.CallbackQuery, **kwargs):
     """Handle category selection for new product"""
-    try:
-        categories = await DatabaseManager.get_categories()
-        
-        if not categories:
-            await MessageHelper.safe_answer_callback(
-                query, 
-                "Категории недоступны. Сначала создайте категорию.", 
-                show_alert=True
-            )
-            return
-        
-        text = (
-            "📁 **Выберите категорию**\n\n"
-            "Выберите категорию для нового продукта:"
-        )
-        
-        keyboard = Keyboards.categories_list(categories, "add_product")
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in select_category_for_product: {e}")
+    categories = await DatabaseManager.get_categories()
+    
+    if not categories:
         await MessageHelper.safe_answer_callback(
             query, 
-            "Ошибка загрузки категорий. Попробуйте снова.", 
+            "Категории недоступны. Сначала создайте категорию.", 
             show_alert=True
         )
+        return
+    
+    text = (
+        "📁 <b>Выберите категорию</b>\n\n"
+        "Выберите категорию для нового продукта:"
+    )
+    
+    keyboard = Keyboards.categories_list(categories, "add_product")
+    
+    await MessageHelper.safe_edit_message(
+        query,
+        text=text,
+        reply_markup=keyboard,
+        parse_mode="HTML"
+    )
 
-@router.callback_query(lambda c: c.data == "admin_questions")
+@router.callback_query(F.data == "admin_questions")
+@router.callback_query(F.data.startswith("admin_questions:"))
 @admin_required
-async def admin_questions_handler(query: types.CallbackQuery, **kwargs):
+async def admin_questions_handler(query: types.CallbackQuery, db_session: AsyncSession, **kwargs):
     """Handle admin questions management"""
-    try:
-        # Get all products with question counts
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            result = await session.execute(
-                text("""
-                SELECT p.id, p.name, c.name as category_name, COUNT(tq.id) as question_count
-                FROM products p 
-                LEFT JOIN categories c ON p.category_id = c.id 
-                LEFT JOIN test_questions tq ON p.id = tq.product_id
-                GROUP BY p.id, p.name, c.name
-                ORDER BY c.name, p.name
-                """)
-            )
-            products = result.fetchall()
-        
-        text = (
-            "❓ **Управление тестами**\n\n"
-            f"Всего продуктов: {len(products)}\n\n"
-        )
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        
-        if products:
-            text += "Выберите продукт для управления вопросами:"
-            
-            for product in products[:10]:  # Limit to 10 for keyboard space
-                display_name = f"{product.name}"
-                if product.category_name:
-                    display_name += f" ({product.category_name})"
-                display_name += f" [{product.question_count} В]"
-                
-                builder.row(
-                    types.InlineKeyboardButton(
-                        text=f"❓ {display_name}",
-                        callback_data=f"manage_questions:{product.id}"
-                    )
-                )
+    # Get one page of products with question counts
+    params = _page_params(query.data)
+    result = await db_session.execute(_PRODUCTS_WITH_QUESTION_COUNT_SQL, params)
+    products = result.fetchall()
+    has_next = len(products) > _ADMIN_PAGE_SIZE
+    products = products[:_ADMIN_PAGE_SIZE]
+    
+    # Counted directly so the total reflects the admin's own changes right away
+    total_products = await db_session.scalar(_PRODUCT_COUNT_SQL)
+    
+    text = (
+        "❓ <b>Управление тестами</b>\n\n"
+        f"Всего продуктов: {total_products}\n\n"
+    )
+    
+    rows = []
+    
+    if products:
+        text += "Выберите продукт для управления вопросами:"
+        
+        for product in products:
+            display_name = f"{product.name}"
+            if product.category_name:
+                display_name += f" ({product.category_name})"
+            display_name += f" [{product.question_count} В]"
             
-            if len(products) > 10:
-                text += f"\n\n(Показано первые 10 из {len(products)} продуктов)"
-        else:
-            text += "Продукты недоступны. Сначала создайте продукты."
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔙 К панели администратора",
-                callback_data="admin_panel"
-            )
-        )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in admin_questions_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки вопросов. Попробуйте снова.", 
-            show_alert=True
-        )
+            rows.append([types.InlineKeyboardButton(
+                text=f"❓ {display_name}",
+                callback_data=f"manage_questions:{product.id}"
+            )])
+        
+        nav_row = _page_nav_row("admin_questions", params["offset"], has_next)
+        if nav_row:
+            rows.append(nav_row)
+    else:
+        text += "Продукты недоступны. Сначала создайте продукты."
+    
+    rows.append([_BACK_TO_ADMIN_BUTTON])
+    
+    await MessageHelper.render_menu(query, text, rows, parse_mode="HTML")
 
-@router.callback_query(lambda c: c.data == "admin_stats")
+@router.callback_query(F.data == "admin_stats")
 @admin_required
 async def admin_stats_handler(query: types.CallbackQuery, **kwargs):
     """Handle admin statistics view"""
-    try:
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            
-            # Get various statistics
-            stats = {}
-            
-            # Total users
-            result = await session.execute(text("SELECT COUNT(*) FROM users"))
-            stats['users'] = result.scalar()
-            
-            # Total categories
-            result = await session.execute(text("SELECT COUNT(*) FROM categories"))
-            stats['categories'] = result.scalar()
-            
-            # Total products
-            result = await session.execute(text("SELECT COUNT(*) FROM products"))
-            stats['products'] = result.scalar()
-            
-            # Total questions
-            result = await session.execute(text("SELECT COUNT(*) FROM test_questions"))
-            stats['questions'] = result.scalar()
-            
-            # Total test results
-            result = await session.execute(text("SELECT COUNT(*) FROM test_results"))
-            stats['test_results'] = result.scalar()
-        
-        text = (
-            "📊 **Статистика системы**\n\n"
-            f"👥 Пользователи: {stats['users']}\n"
-            f"📁 Категории: {stats['categories']}\n"
-            f"📦 Продукты: {stats['products']}\n"
-            f"❓ Вопросы: {stats['questions']}\n"
-            f"📝 Результаты тестов: {stats['test_results']}\n"
-        )
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔙 К панели администратора",
-                callback_data="admin_panel"
-            )
-        )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in admin_stats_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки статистики. Попробуйте снова.", 
-            show_alert=True
-        )
+    # Served from the background-refreshed cache
+    stats = await DatabaseManager.get_cached_stats()
+    
+    text = (
+        "📊 <b>Статистика системы</b>\n\n"
+        f"👥 Пользователи: {stats['users']}\n"
+        f"📁 Категории: {stats['categories']}\n"
+        f"📦 Продукты: {stats['products']}\n"
+        f"❓ Вопросы: {stats['questions']}\n"
+        f"📝 Результаты тестов: {stats['test_results']}\n"
+    )
+    
+    await MessageHelper.safe_edit_message(
+        query,
+        text=text,
+        reply_markup=_BACK_TO_ADMIN_MARKUP,
+        parse_mode="HTML"
+    )
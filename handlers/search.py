@@ -1,18 +1,41 @@
 import logging
-from aiogram import Router, types
+from typing import Final
+from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import DatabaseManager
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import SEARCH_RESULTS_LIMIT, DatabaseManager
 from utils.keyboards import Keyboards
-from utils.helpers import MessageHelper
+from utils.helpers import MessageHelper, ValidationHelper
+from utils.callback_data import SearchResultCallback
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Static buttons and keyboards shared across requests
+_SEARCH_AGAIN_BUTTON: Final = types.InlineKeyboardButton(
+    text="🔍 Искать снова",
+    callback_data="search_products"
+)
+
+_MAIN_MENU_BUTTON: Final = types.InlineKeyboardButton(
+    text="🏠 Главное меню",
+    callback_data="main_menu"
+)
+
+_NO_RESULTS_MARKUP: Final = (
+    InlineKeyboardBuilder()
+    .row(types.InlineKeyboardButton(text="📚 Просмотр категорий", callback_data="knowledge_base"))
+    .row(_SEARCH_AGAIN_BUTTON)
+    .row(_MAIN_MENU_BUTTON)
+    .as_markup()
+)
+
 class SearchStates(StatesGroup):
     waiting_for_query = State()
 
-@router.callback_query(lambda c: c.data == "search_products")
+@router.callback_query(F.data == "search_products")
 async def search_products_handler(query: types.CallbackQuery, state: FSMContext, **kwargs):
     """Handle search products menu"""
     text = (
@@ -34,10 +57,10 @@ async def search_products_handler(query: types.CallbackQuery, state: FSMContext,
     await state.set_state(SearchStates.waiting_for_query)
 
 @router.message(SearchStates.waiting_for_query)
-async def search_query_handler(message: types.Message, state: FSMContext, **kwargs):
+async def search_query_handler(message: types.Message, state: FSMContext, db_session: AsyncSession, **kwargs):
     """Handle search query input"""
     try:
-        query_text = message.text.strip() if message.text else ""
+        query_text = ValidationHelper.normalize_input(message.text)
         
         if len(query_text) < 2:
             await message.answer(
@@ -46,7 +69,7 @@ async def search_query_handler(message: types.Message, state: FSMContext, **kwar
             return
         
         # Search for products
-        products = await DatabaseManager.search_products(query_text)
+        products = await DatabaseManager.search_products(query_text, session=db_session)
         
         await state.clear()
         
@@ -57,189 +80,62 @@ async def search_query_handler(message: types.Message, state: FSMContext, **kwar
                 "Попробуйте использовать другие ключевые слова или просмотрите категории."
             )
             
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            builder = InlineKeyboardBuilder()
-            
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="📚 Просмотр категорий",
-                    callback_data="knowledge_base"
-                )
-            )
-            
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="🔍 Искать снова",
-                    callback_data="search_products"
-                )
-            )
-            
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="🏠 Главное меню",
-                    callback_data="main_menu"
-                )
-            )
-            
             await message.answer(
                 text=text,
-                reply_markup=builder.as_markup(),
+                reply_markup=_NO_RESULTS_MARKUP,
                 parse_mode="Markdown"
             )
             return
         
+        # Results are capped, so a full page means there may be more matches
+        found = f"{SEARCH_RESULTS_LIMIT}+" if len(products) >= SEARCH_RESULTS_LIMIT else str(len(products))
         text = (
             f"🔍 **Результаты поиска**\n\n"
-            f"Найдено {len(products)} продуктов по запросу: '{query_text}'\n\n"
+            f"Найдено {found} продуктов по запросу: '{query_text}'\n\n"
             "Выберите продукт для просмотра:"
         )
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
+        rows = [
+            [types.InlineKeyboardButton(
+                text=f"📦 {product.name}",
+                callback_data=SearchResultCallback(product_id=product.id).pack()
+            )]
+            for product in products
+        ]
+        rows.append([_SEARCH_AGAIN_BUTTON])
+        rows.append([_MAIN_MENU_BUTTON])
         
-        for product in products:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text=f"📦 {product.name}",
-                    callback_data=f"search_result:{product.id}"
-                )
-            )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔍 Искать снова",
-                callback_data="search_products"
-            )
-        )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🏠 Главное меню",
-                callback_data="main_menu"
-            )
-        )
-        
-        await message.answer(
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
+        await MessageHelper.render_menu(message, text, rows, edit=False, parse_mode="Markdown")
         
     except Exception as e:
-        logger.error(f"Error in search_query_handler: {e}")
+        logger.error("Error in search_query_handler: %s", e)
         await message.answer("❌ Ошибка обработки поиска. Попробуйте снова.")
         await state.clear()
 
-@router.callback_query(lambda c: c.data.startswith("search_result:"))
-async def search_result_handler(query: types.CallbackQuery, **kwargs):
+@router.callback_query(SearchResultCallback.filter())
+async def search_result_handler(query: types.CallbackQuery, callback_data: SearchResultCallback, **kwargs):
     """Handle search result selection"""
-    try:
-        product_id = int(query.data.split(":")[1])
-        
-        # Get product with category info
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            result = await session.execute(
-                text("""
-                SELECT p.id, p.name, p.description, p.image_file_id, p.document_file_id, 
-                       c.name as category_name, c.id as category_id
-                FROM products p 
-                LEFT JOIN categories c ON p.category_id = c.id 
-                WHERE p.id = :product_id
-                """),
-                {"product_id": product_id}
-            )
-            product = result.fetchone()
-        
-        if not product:
-            await MessageHelper.safe_answer_callback(
-                query, 
-                "Продукт не найден.", 
-                show_alert=True
-            )
-            return
-        
-        # Check if product has test questions
-        questions = await DatabaseManager.get_test_questions(product_id)
-        has_test = len(questions) > 0
-        
-        text = MessageHelper.format_product_info(product, product.category_name)
-        
-        if has_test:
-            text += f"\n📝 Доступен тест ({len(questions)} вопросов)"
-        
-        # Create keyboard with search-specific back button
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        
-        if has_test:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="📝 Пройти тест",
-                    callback_data=f"start_test:{product_id}"
-                )
-            )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔍 Искать снова",
-                callback_data="search_products"
-            )
-        )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🏠 Главное меню",
-                callback_data="main_menu"
-            )
-        )
-        
-        # Send image/document if available
-        if product.image_file_id:
-            try:
-                await query.message.answer_photo(
-                    photo=product.image_file_id,
-                    caption=text,
-                    reply_markup=builder.as_markup(),
-                    parse_mode="Markdown"
-                )
-                await MessageHelper.safe_answer_callback(query)
-                return
-            except Exception as e:
-                logger.warning(f"Failed to send image: {e}")
-        
-        if product.document_file_id:
-            try:
-                await query.message.answer_document(
-                    document=product.document_file_id,
-                    caption=text,
-                    reply_markup=builder.as_markup(),
-                    parse_mode="Markdown"
-                )
-                await MessageHelper.safe_answer_callback(query)
-                return
-            except Exception as e:
-                logger.warning(f"Failed to send document: {e}")
-        
-        # Send as text message if no files or files failed
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
-        
-    except (ValueError, IndexError) as e:
-        logger.error(f"Invalid product ID in search_result_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Неверный продукт. Попробуйте снова.", 
-            show_alert=True
-        )
-    except Exception as e:
-        logger.error(f"Error in search_result_handler: {e}")
+    product_id = callback_data.product_id
+    
+    # Get product with category info
+    product = await DatabaseManager.get_product_details(product_id)
+    
+    if not product:
         await MessageHelper.safe_answer_callback(
             query, 
-            "Ошибка загрузки продукта. Попробуйте снова.", 
+            "Продукт не найден.", 
             show_alert=True
         )
+        return
+    
+    has_test = product.question_count > 0
+    
+    text = MessageHelper.format_product_info(product, product.category_name)
+    
+    if has_test:
+        text += f"\n📝 Доступен тест ({product.question_count} вопросов)"
+    
+    # Create keyboard with search-specific back button
+    markup = Keyboards.product_actions(product_id, has_test, footer="search")
+    
+    await MessageHelper.send_product(query, product, text, markup, parse_mode="Markdown")
@@ -1,95 +1,125 @@
+import html
 import logging
-import json
-from aiogram import Router, types
+from functools import lru_cache
+from typing import Final, Optional, Tuple
+from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import DatabaseManager
 from utils.keyboards import Keyboards
-from utils.helpers import MessageHelper
+from utils.helpers import MessageHelper, ValidationHelper
+from utils.session_store import test_sessions
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Question message layout, sent as HTML with escaped question texts so
+# Markdown characters in them cannot make Telegram reject the edit
+_QUESTION_HEADER_TEMPLATE: Final = "📝 <b>Вопрос {number}/{total}</b>\n\n"
+
+_QUESTION_BODY_TEMPLATE: Final = (
+    "❓ {question}\n\n"
+    "{options}\n\n"
+    "Выберите ваш ответ:"
+)
+
+# Static buttons and keyboards shared across requests
+_BACK_TO_CATEGORIES_BUTTON: Final = types.InlineKeyboardButton(
+    text="🔙 К категориям",
+    callback_data="take_test"
+)
+
+_MAIN_MENU_BUTTON: Final = types.InlineKeyboardButton(
+    text="🏠 Главное меню",
+    callback_data="main_menu"
+)
+
+_NO_CATEGORIES_MARKUP: Final = (
+    InlineKeyboardBuilder()
+    .row(types.InlineKeyboardButton(text="🔙 В главное меню", callback_data="main_menu"))
+    .as_markup()
+)
+
+_NO_TESTS_MARKUP: Final = InlineKeyboardBuilder().row(_BACK_TO_CATEGORIES_BUTTON).as_markup()
+
+_TEST_COMPLETED_MARKUP: Final = (
+    InlineKeyboardBuilder()
+    .row(types.InlineKeyboardButton(text="🔄 Пройти другой тест", callback_data="take_test"))
+    .row(types.InlineKeyboardButton(text="📊 Мои результаты", callback_data="my_results"))
+    .row(_MAIN_MENU_BUTTON)
+    .as_markup()
+)
+
+_RESULTS_MARKUP: Final = (
+    InlineKeyboardBuilder()
+    .row(types.InlineKeyboardButton(text="🔄 Пройти еще тест", callback_data="take_test"))
+    .row(_MAIN_MENU_BUTTON)
+    .as_markup()
+)
+
+_NO_RESULTS_MARKUP: Final = InlineKeyboardBuilder().row(_MAIN_MENU_BUTTON).as_markup()
+
+@lru_cache(maxsize=1024)
+def _render_question_body(question: str, options: Tuple[str, ...]) -> str:
+    """Render question text and options once per distinct question content"""
+    return _QUESTION_BODY_TEMPLATE.format(
+        question=html.escape(question),
+        options="\n".join(
+            f"🔘 {chr(65 + i)}) {html.escape(option)}" for i, option in enumerate(options)
+        )
+    )
+
 class TestStates(StatesGroup):
     taking_test = State()
 
-# Store test sessions in memory (in production, use Redis or database)
-test_sessions = {}
-
-@router.callback_query(lambda c: c.data == "take_test")
+@router.callback_query(F.data == "take_test")
 async def take_test_menu(query: types.CallbackQuery, **kwargs):
     """Handle take test menu"""
-    try:
-        categories = await DatabaseManager.get_categories()
-        
-        if not categories:
-            text = (
-                "📝 **Пройти тест**\n\n"
-                "Категории тестов пока недоступны.\n"
-                "Обратитесь к администратору для добавления тестов."
-            )
-            
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            builder = InlineKeyboardBuilder()
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="🔙 В главное меню",
-                    callback_data="main_menu"
-                )
-            )
-            
-            await MessageHelper.safe_edit_message(
-                query,
-                text=text,
-                reply_markup=builder.as_markup(),
-                parse_mode="Markdown"
-            )
-            return
-        
+    categories = await DatabaseManager.get_categories()
+    
+    if not categories:
         text = (
             "📝 **Пройти тест**\n\n"
-            "Выберите категорию для прохождения теста:"
+            "Категории тестов пока недоступны.\n"
+            "Обратитесь к администратору для добавления тестов."
         )
         
-        keyboard = Keyboards.categories_list(categories, "test_category")
-        
         await MessageHelper.safe_edit_message(
             query,
             text=text,
-            reply_markup=keyboard,
+            reply_markup=_NO_CATEGORIES_MARKUP,
             parse_mode="Markdown"
         )
-        
-    except Exception as e:
-        logger.error(f"Error in take_test_menu: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки меню тестов. Попробуйте снова.", 
-            show_alert=True
-        )
+        await MessageHelper.safe_answer_callback(query)
+        return
+    
+    text = (
+        "📝 **Пройти тест**\n\n"
+        "Выберите категорию для прохождения теста:"
+    )
+    
+    keyboard = Keyboards.categories_list(categories, "test_category")
+    
+    await MessageHelper.safe_edit_message(
+        query,
+        text=text,
+        reply_markup=keyboard,
+        parse_mode="Markdown"
+    )
+    
+    # Answer only once the work is done, so the error handler can still alert
+    await MessageHelper.safe_answer_callback(query)
 
-@router.callback_query(lambda c: c.data.startswith("test_category:"))
+@router.callback_query(F.data.startswith("test_category:"))
 async def test_category_handler(query: types.CallbackQuery, **kwargs):
     """Handle test category selection"""
     try:
-        category_id = int(query.data.split(":")[1])
+        category_id = int(query.data.partition(":")[2])
         
         # Get products in this category that have test questions
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            result = await session.execute(
-                text("""
-                SELECT DISTINCT p.id, p.name, COUNT(tq.id) as question_count
-                FROM products p 
-                INNER JOIN test_questions tq ON p.id = tq.product_id
-                WHERE p.category_id = :category_id
-                GROUP BY p.id, p.name
-                HAVING COUNT(tq.id) > 0
-                ORDER BY p.name
-                """),
-                {"category_id": category_id}
-            )
-            products = result.fetchall()
+        products = await DatabaseManager.get_test_products(category_id)
         
         if not products:
             text = (
@@ -98,19 +128,10 @@ async def test_category_handler(query: types.CallbackQuery, **kwargs):
                 "Попробуйте другую категорию или обратитесь к администратору."
             )
             
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            builder = InlineKeyboardBuilder()
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="🔙 К категориям",
-                    callback_data="take_test"
-                )
-            )
-            
             await MessageHelper.safe_edit_message(
                 query,
                 text=text,
-                reply_markup=builder.as_markup(),
+                reply_markup=_NO_TESTS_MARKUP,
                 parse_mode="Markdown"
             )
             return
@@ -120,51 +141,30 @@ async def test_category_handler(query: types.CallbackQuery, **kwargs):
             "Выберите продукт для прохождения теста:"
         )
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
+        rows = [
+            [types.InlineKeyboardButton(
+                text=f"📝 {product.name} ({product.question_count} вопросов)",
+                callback_data=f"start_test:{product.id}"
+            )]
+            for product in products
+        ]
+        rows.append([_BACK_TO_CATEGORIES_BUTTON])
         
-        for product in products:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text=f"📝 {product.name} ({product.question_count} вопросов)",
-                    callback_data=f"start_test:{product.id}"
-                )
-            )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔙 К категориям",
-                callback_data="take_test"
-            )
-        )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
+        await MessageHelper.render_menu(query, text, rows, parse_mode="Markdown")
         
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid category ID in test_category_handler: {e}")
+        logger.error("Invalid category ID in test_category_handler: %s", e)
         await MessageHelper.safe_answer_callback(
             query, 
             "Неверная категория. Попробуйте снова.", 
             show_alert=True
         )
-    except Exception as e:
-        logger.error(f"Error in test_category_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки тестов. Попробуйте снова.", 
-            show_alert=True
-        )
 
-@router.callback_query(lambda c: c.data.startswith("start_test:"))
+@router.callback_query(F.data.startswith("start_test:"))
 async def start_test_handler(query: types.CallbackQuery, state: FSMContext, user=None, **kwargs):
     """Handle test start"""
     try:
-        product_id = int(query.data.split(":")[1])
+        product_id = int(query.data.partition(":")[2])
         
         # Get test questions
         questions = await DatabaseManager.get_test_questions(product_id)
@@ -179,99 +179,95 @@ async def start_test_handler(query: types.CallbackQuery, state: FSMContext, user
         
         # Create test session
         session_key = f"{user.telegram_id}_{product_id}"
-        test_sessions[session_key] = {
-            'product_id': product_id,
-            'questions': [q for q in questions],
-            'current_question': 0,
-            'answers': {},
-            'correct_answers': 0
-        }
+        await test_sessions.create(
+            session_key,
+            user.telegram_id,
+            product_id,
+            [q.id for q in questions],
+            "".join(q.correct_answer.upper() for q in questions)
+        )
         
         await state.set_state(TestStates.taking_test)
         await state.update_data(session_key=session_key)
         
-        # Show first question
+        # Show first question, then answer the press once the work is done
         await show_question(query, session_key)
+        await MessageHelper.safe_answer_callback(query)
         
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid product ID in start_test_handler: {e}")
+        logger.error("Invalid product ID in start_test_handler: %s", e)
         await MessageHelper.safe_answer_callback(
             query, 
             "Неверный продукт. Попробуйте снова.", 
             show_alert=True
         )
-    except Exception as e:
-        logger.error(f"Error in start_test_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка запуска теста. Попробуйте снова.", 
-            show_alert=True
-        )
 
-async def show_question(query: types.CallbackQuery, session_key: str):
+async def show_question(query: types.CallbackQuery, session_key: str, session: Optional[dict] = None):
     """Show current test question"""
-    try:
-        session = test_sessions.get(session_key)
-        if not session:
-            await MessageHelper.safe_answer_callback(
-                query, 
-                "Сессия теста истекла. Начните новый тест.", 
-                show_alert=True
-            )
-            return
-        
-        current_idx = session['current_question']
-        questions = session['questions']
-        
-        if current_idx >= len(questions):
-            # Test completed
-            await complete_test(query, session_key)
-            return
-        
-        question = questions[current_idx]
-        
-        text = (
-            f"📝 **Вопрос {current_idx + 1}/{len(questions)}**\n\n"
-            f"❓ {question.question}\n\n"
-            f"🔘 A) {question.option_a}\n"
-            f"🔘 B) {question.option_b}\n"
-            f"🔘 C) {question.option_c}\n"
-            f"🔘 D) {question.option_d}\n\n"
-            "Выберите ваш ответ:"
-        )
-        
-        keyboard = Keyboards.test_question(
-            question.id, 
-            current_idx + 1, 
-            len(questions)
-        )
-        
+    if session is None:
+        session = await test_sessions.get(session_key)
+    if not session:
+        # The press may already be answered with feedback, so report it in the message
         await MessageHelper.safe_edit_message(
             query,
-            text=text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
+            text="Сессия теста истекла. Начните новый тест.",
+            reply_markup=_NO_TESTS_MARKUP
         )
-        
-    except Exception as e:
-        logger.error(f"Error in show_question: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка отображения вопроса. Попробуйте снова.", 
-            show_alert=True
+        return
+    
+    current_idx = session['current_question']
+    question_ids = session['question_ids']
+    
+    if current_idx >= len(question_ids):
+        # Test completed
+        await complete_test(query, session_key)
+        return
+    
+    question = await DatabaseManager.get_test_question(session['product_id'], question_ids[current_idx])
+    if not question:
+        # The question was removed after the test started
+        await test_sessions.delete(session_key)
+        await MessageHelper.safe_edit_message(
+            query,
+            text="Тест был изменен. Начните новый тест.",
+            reply_markup=_NO_TESTS_MARKUP
         )
+        return
+    
+    text = (
+        _QUESTION_HEADER_TEMPLATE.format(number=current_idx + 1, total=len(question_ids))
+        + _render_question_body(question.question, tuple(question.options))
+    )
+    
+    keyboard = Keyboards.test_question(
+        question.id, 
+        current_idx + 1, 
+        len(question_ids)
+    )
+    
+    await MessageHelper.safe_edit_message(
+        query,
+        text=text,
+        reply_markup=keyboard,
+        parse_mode="HTML"
+    )
 
-@router.callback_query(lambda c: c.data.startswith("answer:"))
+@router.callback_query(F.data.startswith("answer:"))
 async def answer_handler(query: types.CallbackQuery, state: FSMContext, **kwargs):
     """Handle test answer"""
     try:
-        _, question_id, answer = query.data.split(":")
+        question_id, _, answer = query.data.partition(":")[2].partition(":")
         question_id = int(question_id)
         
+        # Callback data comes from the client, so only accept one of the option letters
+        if not ValidationHelper.is_valid_answer(answer):
+            raise ValueError(f"unexpected answer {answer!r}")
+        
         state_data = await state.get_data()
         session_key = state_data.get('session_key')
         
-        if not session_key or session_key not in test_sessions:
+        session = await test_sessions.get(session_key) if session_key else None
+        if not session:
             await MessageHelper.safe_answer_callback(
                 query, 
                 "Сессия теста истекла. Начните новый тест.", 
@@ -279,190 +275,106 @@ async def answer_handler(query: types.CallbackQuery, state: FSMContext, **kwargs
             )
             return
         
-        session = test_sessions[session_key]
         current_idx = session['current_question']
-        questions = session['questions']
+        question_ids = session['question_ids']
         
-        if current_idx >= len(questions):
+        if current_idx >= len(question_ids):
             await complete_test(query, session_key)
             return
         
-        current_question = questions[current_idx]
-        
         # Check if answer is correct
-        is_correct = answer.upper() == current_question.correct_answer.upper()
-        if is_correct:
-            session['correct_answers'] += 1
-        
-        # Store answer
-        session['answers'][question_id] = {
-            'answer': answer,
-            'correct': is_correct
-        }
+        correct_answer = session['answer_key'][current_idx]
+        is_correct = answer.upper() == correct_answer
+        
+        # Store answer and move to next question; ignore repeated taps on the same question
+        if question_id != question_ids[current_idx] or not await test_sessions.record_answer(
+            session_key, current_idx, question_id, answer, is_correct
+        ):
+            await MessageHelper.safe_answer_callback(query)
+            return
         
-        # Move to next question
-        session['current_question'] += 1
+        session['current_question'] = current_idx + 1
+        DatabaseManager.queue_test_answer(
+            query.from_user.id, session['product_id'], question_id, answer, is_correct
+        )
         
         # Show feedback and continue
-        feedback = "✅ Правильно!" if is_correct else f"❌ Неправильно. Правильный ответ: {current_question.correct_answer}."
+        feedback = "✅ Правильно!" if is_correct else f"❌ Неправильно. Правильный ответ: {correct_answer}."
         await MessageHelper.safe_answer_callback(query, feedback, show_alert=False)
         
         # Show next question or complete test
-        await show_question(query, session_key)
+        await show_question(query, session_key, session)
         
     except (ValueError, IndexError) as e:
-        logger.error(f"Invalid answer format in answer_handler: {e}")
+        logger.error("Invalid answer format in answer_handler: %s", e)
         await MessageHelper.safe_answer_callback(
             query, 
             "Неверный формат ответа. Попробуйте снова.", 
             show_alert=True
         )
-    except Exception as e:
-        logger.error(f"Error in answer_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка обработки ответа. Попробуйте снова.", 
-            show_alert=True
-        )
 
 async def complete_test(query: types.CallbackQuery, session_key: str):
     """Complete the test and show results"""
-    try:
-        session = test_sessions.get(session_key)
-        if not session:
-            return
-        
-        # Calculate score
-        total_questions = len(session['questions'])
-        correct_answers = session['correct_answers']
-        score = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
-        
-        # Save result to database
-        user_id = int(session_key.split('_')[0])
-        product_id = session['product_id']
-        
-        await DatabaseManager.save_test_result(
-            user_id=user_id,
-            product_id=product_id,
-            score=score,
-            total_questions=total_questions,
-            correct_answers=correct_answers
-        )
-        
-        # Clean up session
-        del test_sessions[session_key]
-        
-        # Show results
-        text = MessageHelper.format_test_result(score, correct_answers, total_questions)
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🔄 Пройти другой тест",
-                callback_data="take_test"
-            )
-        )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="📊 Мои результаты",
-                callback_data="my_results"
-            )
-        )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🏠 Главное меню",
-                callback_data="main_menu"
-            )
-        )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
-        )
-        
-    except Exception as e:
-        logger.error(f"Error in complete_test: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка завершения теста. Попробуйте снова.", 
-            show_alert=True
-        )
+    session = await test_sessions.get(session_key)
+    if not session:
+        return
+    
+    # Calculate score
+    total_questions = len(session['question_ids'])
+    correct_answers = sum(1 for answer in session['answers'].values() if answer['correct'])
+    score = (correct_answers / total_questions) * 100 if total_questions > 0 else 0
+    
+    # Save result right away so "My results" shows it immediately
+    await DatabaseManager.save_test_result(
+        user_id=session['user_id'],
+        product_id=session['product_id'],
+        score=score,
+        total_questions=total_questions,
+        correct_answers=correct_answers
+    )
+    
+    # Clean up session
+    await test_sessions.delete(session_key)
+    
+    # Show results
+    text = MessageHelper.format_test_result(score, correct_answers, total_questions)
+    
+    await MessageHelper.safe_edit_message(
+        query,
+        text=text,
+        reply_markup=_TEST_COMPLETED_MARKUP,
+        parse_mode="HTML"
+    )
 
-@router.callback_query(lambda c: c.data == "my_results")
-async def my_results_handler(query: types.CallbackQuery, user=None, **kwargs):
+@router.callback_query(F.data == "my_results")
+async def my_results_handler(query: types.CallbackQuery, db_session: AsyncSession, user=None, **kwargs):
     """Handle user results view"""
-    try:
-        # Get user's test results
-        async with DatabaseManager.AsyncSessionLocal() as session:
-            from sqlalchemy import text
-            result = await session.execute(
-                text("""
-                SELECT tr.score, tr.total_questions, tr.correct_answers, tr.completed_at, p.name as product_name
-                FROM test_results tr
-                INNER JOIN products p ON tr.product_id = p.id
-                WHERE tr.user_id = :user_id
-                ORDER BY tr.completed_at DESC
-                LIMIT 10
-                """),
-                {"user_id": user.telegram_id}
-            )
-            results = result.fetchall()
-        
-        if not results:
-            text = (
-                "📊 **Мои результаты**\n\n"
-                "Вы еще не проходили тесты.\n"
-                "Пройдите первый тест, чтобы увидеть результаты здесь!"
-            )
-        else:
-            text = (
-                f"📊 **Мои результаты**\n\n"
-                f"Результаты последних тестов (показано {len(results)}):\n\n"
-            )
-            
-            for i, result in enumerate(results, 1):
-                date_str = result.completed_at.strftime("%Y-%m-%d %H:%M")
-                text += (
-                    f"{i}. **{result.product_name}**\n"
-                    f"   Балл: {result.score:.1f}% ({result.correct_answers}/{result.total_questions})\n"
-                    f"   Дата: {date_str}\n\n"
-                )
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        builder = InlineKeyboardBuilder()
-        
-        if results:
-            builder.row(
-                types.InlineKeyboardButton(
-                    text="🔄 Пройти еще тест",
-                    callback_data="take_test"
-                )
-            )
-        
-        builder.row(
-            types.InlineKeyboardButton(
-                text="🏠 Главное меню",
-                callback_data="main_menu"
-            )
+    # Get user's test results
+    results = await DatabaseManager.get_user_results(user.telegram_id, session=db_session)
+    
+    if not results:
+        text = (
+            "📊 **Мои результаты**\n\n"
+            "Вы еще не проходили тесты.\n"
+            "Пройдите первый тест, чтобы увидеть результаты здесь!"
         )
-        
-        await MessageHelper.safe_edit_message(
-            query,
-            text=text,
-            reply_markup=builder.as_markup(),
-            parse_mode="Markdown"
+    else:
+        header = (
+            f"📊 **Мои результаты**\n\n"
+            f"Результаты последних тестов (показано {len(results)}):\n\n"
         )
         
-    except Exception as e:
-        logger.error(f"Error in my_results_handler: {e}")
-        await MessageHelper.safe_answer_callback(
-            query, 
-            "Ошибка загрузки результатов. Попробуйте снова.", 
-            show_alert=True
-        )
+        parts = [
+            f"{i}. **{result.product.name}**\n"
+            f"   Балл: {result.score:.1f}% ({result.correct_answers}/{result.total_questions})\n"
+            f"   Дата: {result.completed_at:%Y-%m-%d %H:%M}"
+            for i, result in enumerate(results, 1)
+        ]
+        text = header + "\n\n".join(parts)
+    
+    await MessageHelper.safe_edit_message(
+        query,
+        text=text,
+        reply_markup=_RESULTS_MARKUP if results else _NO_RESULTS_MARKUP,
+        parse_mode="Markdown"
+    )
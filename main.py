@@ -1,19 +1,22 @@
 import logging
-import os
 import sys
 import asyncio
 from aiohttp import web
 from aiogram import Bot, Dispatcher, types
+from aiogram.types import ErrorEvent
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
 
 # Import configuration
-from config import BOT_TOKEN, PORT, WEBHOOK_URL, WEBHOOK_PATH
+from config import BOT_TOKEN, PORT, WEBHOOK_URL, WEBHOOK_PATH, REDIS_URL, BOT_API_CONNECTIONS
 
 # Import database
-from database import init_database
+from database import init_database, refresh_stats_cache, write_test_answers, redis_client, DatabaseManager
 
 # Import middleware
 from middleware.auth import AuthMiddleware
+from middleware.database import DbSessionMiddleware
+from middleware.debounce import DebounceMiddleware
 
 # Import handlers
 from handlers import (
@@ -24,6 +27,10 @@ from handlers import (
     search_router
 )
 
+# Import helpers
+from utils.helpers import MessageHelper
+from utils.keyboards import Keyboards
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,18 +40,30 @@ logger = logging.getLogger(__name__)
 
 print("[BOOT] Corporate Training Bot started")
 
-# Create bot and dispatcher with memory storage for FSM
-storage = MemoryStorage()
+# Create FSM storage: Redis keeps states across restarts and workers,
+# memory storage is used for local development
+if REDIS_URL:
+    from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+    # Keys include the bot id so several bots can share one Redis database
+    storage = RedisStorage.from_url(REDIS_URL, key_builder=DefaultKeyBuilder(with_bot_id=True))
+    logger.info("[BOOT] Using Redis FSM storage")
+else:
+    storage = MemoryStorage()
+    logger.info("[BOOT] Using in-memory FSM storage")
 
 # Validate BOT_TOKEN before creating bot
 if not BOT_TOKEN:
     logger.error("BOT_TOKEN is required but not set")
     sys.exit(1)
 
-bot = Bot(token=BOT_TOKEN)
+# Bot API connection limit is configurable for deployments with bursty replies
+bot = Bot(token=BOT_TOKEN, session=AiohttpSession(limit=BOT_API_CONNECTIONS))
 dp = Dispatcher(storage=storage)
 
 # Register middleware
+dp.callback_query.outer_middleware(DebounceMiddleware())
+dp.message.middleware(DbSessionMiddleware())
+dp.callback_query.middleware(DbSessionMiddleware())
 dp.message.middleware(AuthMiddleware())
 dp.callback_query.middleware(AuthMiddleware())
 
@@ -55,37 +74,43 @@ dp.include_router(knowledge_router)
 dp.include_router(testing_router)
 dp.include_router(search_router)
 
-# Global error handler
+# Global error handler for exceptions not handled in the handlers themselves
 @dp.error()
-async def error_handler(event, exception):
+async def error_handler(event: ErrorEvent):
     """Global error handler"""
-    logger.error(f"Error occurred: {exception}")
+    update = event.update
+    logger.error("Error while handling update %s", update.update_id, exc_info=event.exception)
     
-    if hasattr(event, 'message') and event.message:
+    if update.callback_query:
+        await MessageHelper.safe_answer_callback(
+            update.callback_query,
+            "❌ Произошла ошибка. Попробуйте снова.",
+            show_alert=True
+        )
+    elif update.message:
         try:
-            await event.message.answer(
+            await update.message.answer(
                 "❌ Произошла неожиданная ошибка. Попробуйте снова или обратитесь в поддержку."
             )
         except Exception as e:
-            logger.error(f"Failed to send error message: {e}")
+            logger.error("Failed to send error message: %s", e)
     
     return True
 
 # Fallback handler for unhandled messages
+_FALLBACK_TEXT = (
+    "🤔 Я не понимаю эту команду.\n\n"
+    "Используйте /start чтобы увидеть доступные опции или выберите из меню ниже:"
+)
+
 @dp.message()
 async def fallback_handler(message: types.Message, **kwargs):
     """Fallback handler for unhandled messages"""
     user_id = message.from_user.id if message.from_user else 0
-    logger.info(f"Unhandled message from user {user_id}: {message.text}")
+    logger.info("Unhandled message from user %s: %s", user_id, message.text)
     
-    text = (
-        "🤔 Я не понимаю эту команду.\n\n"
-        "Используйте /start чтобы увидеть доступные опции или выберите из меню ниже:"
-    )
-    
-    from utils.keyboards import Keyboards
     await message.answer(
-        text=text,
+        text=_FALLBACK_TEXT,
         reply_markup=Keyboards.main_menu(is_admin=kwargs.get('is_admin', False))
     )
 
@@ -94,9 +119,8 @@ async def fallback_handler(message: types.Message, **kwargs):
 async def fallback_callback_handler(query: types.CallbackQuery, **kwargs):
     """Fallback handler for unhandled callbacks"""
     user_id = query.from_user.id if query.from_user else 0
-    logger.info(f"Unhandled callback from user {user_id}: {query.data}")
+    logger.info("Unhandled callback from user %s: %s", user_id, query.data)
     
-    from utils.helpers import MessageHelper
     await MessageHelper.safe_answer_callback(
         query, 
         "❌ Это действие недоступно. Попробуйте снова.", 
@@ -130,14 +154,15 @@ async def webhook_handler(request):
     """Handle incoming webhook requests"""
     logger.info("[HTTP] Webhook POST received")
     try:
-        update_data = await request.json()
-        update = types.Update.model_validate(update_data)
-        logger.info(f"[UPDATE] Processing update: {update.update_id}")
+        # Validate straight from the raw body, mounted to the bot so feed_update
+        # does not have to re-create the update for it
+        update = types.Update.model_validate_json(await request.read(), context={"bot": bot})
+        logger.info("[UPDATE] Processing update: %s", update.update_id)
         
         await dp.feed_update(bot, update)
         
     except Exception as e:
-        logger.error(f"[ERROR] Webhook handler error: {e}")
+        logger.error("[ERROR] Webhook handler error: %s", e)
         return web.Response(status=500, text="Internal Server Error")
     
     return web.Response(text="OK")
@@ -154,20 +179,33 @@ async def on_startup(app):
         await init_database()
         logger.info("[STARTUP] Database initialized")
         
+        # Open pooled connections before the first update arrives
+        try:
+            await DatabaseManager.warm_pool()
+            logger.info("[STARTUP] Database pool warmed")
+        except Exception as pool_error:
+            logger.warning("[STARTUP] Could not warm database pool: %s", pool_error)
+        
+        # Keep admin statistics precomputed in the background
+        app["stats_task"] = asyncio.create_task(refresh_stats_cache())
+        
+        # Save test answers in batches behind the handlers
+        app["answers_task"] = asyncio.create_task(write_test_answers())
+        
         # Try to set webhook, but don't fail if it can't be set
         try:
             await bot.set_webhook(WEBHOOK_URL)
-            logger.info(f"[STARTUP] Webhook set to: {WEBHOOK_URL}")
+            logger.info("[STARTUP] Webhook set to: %s", WEBHOOK_URL)
         except Exception as webhook_error:
-            logger.warning(f"[STARTUP] Could not set webhook: {webhook_error}")
+            logger.warning("[STARTUP] Could not set webhook: %s", webhook_error)
             logger.info("[STARTUP] Bot will work in webhook mode when accessible")
         
         # Get bot info
         bot_info = await bot.get_me()
-        logger.info(f"[STARTUP] Bot started: @{bot_info.username}")
+        logger.info("[STARTUP] Bot started: @%s", bot_info.username)
         
     except Exception as e:
-        logger.error(f"[STARTUP ERROR] {e}")
+        logger.error("[STARTUP ERROR] %s", e)
         # Don't exit on webhook errors, continue running
         if "webhook" not in str(e).lower():
             sys.exit(1)
@@ -179,6 +217,19 @@ async def on_shutdown(app):
     """Application shutdown handler"""
     logger.info("[SHUTDOWN] Shutting down application...")
     
+    stats_task = app.get("stats_task")
+    if stats_task:
+        stats_task.cancel()
+    
+    # Let the write-behind task flush what is still queued
+    answers_task = app.get("answers_task")
+    if answers_task:
+        answers_task.cancel()
+        try:
+            await answers_task
+        except asyncio.CancelledError:
+            pass
+    
     try:
         # Delete webhook
         await bot.delete_webhook()
@@ -188,8 +239,15 @@ async def on_shutdown(app):
         await bot.session.close()
         logger.info("[SHUTDOWN] Bot session closed")
         
+        # Close FSM storage connections
+        await storage.close()
+        
+        # Close shared Redis client
+        if redis_client:
+            await redis_client.aclose()
+        
     except Exception as e:
-        logger.error(f"[SHUTDOWN ERROR] {e}")
+        logger.error("[SHUTDOWN ERROR] %s", e)
 
 app.on_shutdown.append(on_shutdown)
 
@@ -205,5 +263,5 @@ if __name__ == "__main__":
             access_log=logger
         )
     except Exception as e:
-        logger.error(f"[MAIN ERROR] {e}")
+        logger.error("[MAIN ERROR] %s", e)
         sys.exit(1)
@@ -1,15 +1,25 @@
 import logging
-from typing import Any, Awaitable, Callable, Dict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet
+import orjson
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
-from database import DatabaseManager
+from database import DatabaseManager, redis_client
+from models import User
 from config import ADMIN_IDS
+from utils.helpers import MessageHelper
 
 logger = logging.getLogger(__name__)
 
+# Authenticated users are cached in Redis, which also limits last_activity writes to one per TTL
+USER_CACHE_TTL = 60  # seconds
+_USER_CACHE_FIELDS = ('id', 'telegram_id', 'username', 'first_name', 'last_name', 'is_admin')
+
 class AuthMiddleware(BaseMiddleware):
     """Middleware for user authentication and authorization"""
     
+    def __init__(self, admin_ids: FrozenSet[int] = ADMIN_IDS):
+        self.admin_ids = admin_ids
+    
     async def __call__(
         self,
         handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
@@ -25,31 +35,65 @@ class AuthMiddleware(BaseMiddleware):
         
         try:
             # Check if user is admin
-            is_admin = user_info.id in ADMIN_IDS
+            is_admin = user_info.id in self.admin_ids
             
-            # Get or create user in database
-            user = await DatabaseManager.get_or_create_user(
-                telegram_id=user_info.id,
-                username=user_info.username,
-                first_name=user_info.first_name,
-                last_name=user_info.last_name,
-                is_admin=is_admin
-            )
+            user = await self._get_cached_user(user_info.id)
+            if user is None:
+                # Get or create user in database
+                user = await DatabaseManager.get_or_create_user(
+                    telegram_id=user_info.id,
+                    username=user_info.username,
+                    first_name=user_info.first_name,
+                    last_name=user_info.last_name,
+                    is_admin=is_admin,
+                    session=data.get('db_session')
+                )
+                await self._cache_user(user)
             
             # Add user and admin status to handler data
             data['user'] = user
             data['is_admin'] = is_admin
             
-            logger.info(f"User {user_info.id} authenticated (admin: {is_admin})")
+            logger.info("User %s authenticated (admin: %s)", user_info.id, is_admin)
             
         except Exception as e:
-            logger.error(f"Error in auth middleware: {e}")
+            logger.error("Error in auth middleware: %s", e)
+            # A failed upsert aborts the shared session's transaction, so reset it for the handler
+            db_session = data.get('db_session')
+            if db_session is not None:
+                try:
+                    await db_session.rollback()
+                except Exception as rollback_error:
+                    logger.error("Failed to roll back database session: %s", rollback_error)
             # Continue without user data if there's an error
             data['user'] = None
             data['is_admin'] = False
         
         return await handler(event, data)
 
+    @staticmethod
+    async def _get_cached_user(telegram_id: int):
+        """Get user from the Redis cache, if enabled"""
+        if not redis_client:
+            return None
+        try:
+            cached = await redis_client.get(f"user:{telegram_id}")
+        except Exception as e:
+            logger.warning("Failed to read user cache: %s", e)
+            return None
+        return User(**orjson.loads(cached)) if cached else None
+    
+    @staticmethod
+    async def _cache_user(user: User):
+        """Store user in the Redis cache, if enabled"""
+        if not redis_client:
+            return
+        try:
+            payload = {field: getattr(user, field) for field in _USER_CACHE_FIELDS}
+            await redis_client.set(f"user:{user.telegram_id}", orjson.dumps(payload), ex=USER_CACHE_TTL)
+        except Exception as e:
+            logger.warning("Failed to write user cache: %s", e)
+
 def admin_required(func):
     """Decorator to require admin privileges"""
     async def wrapper(message_or_query, **kwargs):
@@ -65,7 +109,6 @@ def admin_required(func):
                 )
             else:
                 # It's a CallbackQuery
-                from utils.helpers import MessageHelper
                 await MessageHelper.safe_answer_callback(
                     message_or_query,
                     "❌ Доступ запрещен. Требуются права администратора.",
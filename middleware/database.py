@@ -0,0 +1,24 @@
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from database import AsyncSessionLocal
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Middleware providing one database session per update"""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Open a session, pass it to handlers as db_session and commit on success"""
+        async with AsyncSessionLocal() as session:
+            data['db_session'] = session
+            try:
+                result = await handler(event, data)
+                await session.commit()
+                return result
+            except Exception:
+                await session.rollback()
+                raise
@@ -0,0 +1,41 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+# Repeated presses of the same button within this window are dropped
+DEBOUNCE_INTERVAL = 0.5  # seconds
+_MAX_TRACKED_PRESSES = 10000
+
+class DebounceMiddleware(BaseMiddleware):
+    """Middleware answering accidental double taps without running handlers again"""
+
+    def __init__(self, interval: float = DEBOUNCE_INTERVAL):
+        self.interval = interval
+        self._last_pressed: Dict[Tuple[int, str], float] = {}
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Skip the update if the user pressed the same button a moment ago"""
+        key = (event.from_user.id, event.data or "")
+        now = time.monotonic()
+        last = self._last_pressed.get(key)
+
+        if last is not None and now - last < self.interval:
+            try:
+                await event.answer()
+            except Exception:
+                pass  # Fail silently if answer fails
+            return None
+
+        if len(self._last_pressed) >= _MAX_TRACKED_PRESSES:
+            # Forget presses that are already outside the window
+            cutoff = now - self.interval
+            self._last_pressed = {k: t for k, t in self._last_pressed.items() if t > cutoff}
+        self._last_pressed[key] = now
+
+        return await handler(event, data)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float
+from sqlalchemy import Integer, String, Text, DateTime, Boolean, ForeignKey, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
@@ -24,11 +24,11 @@ class User(Base):
 class Category(Base):
     __tablename__ = "categories"
     
-    id = Column(Integer, primary_key=True)
-    name = Column(String(255), nullable=False)
-    description = Column(Text)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    created_by = Column(Integer, ForeignKey("users.telegram_id"))
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False, unique=True, index=True)
+    description: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
+    created_by: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.telegram_id"))
     
     # Relationships
     products = relationship("Product", back_populates="category")
@@ -36,14 +36,14 @@ class Category(Base):
 class Product(Base):
     __tablename__ = "products"
     
-    id = Column(Integer, primary_key=True)
-    name = Column(String(255), nullable=False)
-    description = Column(Text)
-    category_id = Column(Integer, ForeignKey("categories.id"))
-    image_file_id = Column(String(255))  # Telegram file ID
-    document_file_id = Column(String(255))  # Telegram file ID
-    created_at = Column(DateTime, default=datetime.utcnow)
-    created_by = Column(Integer, ForeignKey("users.telegram_id"))
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    description: Mapped[Optional[str]] = mapped_column(Text)
+    category_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("categories.id"), index=True)
+    image_file_id: Mapped[Optional[str]] = mapped_column(String(255))  # Telegram file ID
+    document_file_id: Mapped[Optional[str]] = mapped_column(String(255))  # Telegram file ID
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
+    created_by: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.telegram_id"))
     
     # Relationships
     category = relationship("Category", back_populates="products")
@@ -52,30 +52,52 @@ class Product(Base):
 class TestQuestion(Base):
     __tablename__ = "test_questions"
     
-    id = Column(Integer, primary_key=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
-    question = Column(Text, nullable=False)
-    option_a = Column(String(500), nullable=False)
-    option_b = Column(String(500), nullable=False)
-    option_c = Column(String(500), nullable=False)
-    option_d = Column(String(500), nullable=False)
-    correct_answer = Column(String(1), nullable=False)  # A, B, C, or D
-    created_at = Column(DateTime, default=datetime.utcnow)
-    created_by = Column(Integer, ForeignKey("users.telegram_id"))
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    product_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("products.id"), index=True)
+    question: Mapped[str] = mapped_column(Text, nullable=False)
+    option_a: Mapped[str] = mapped_column(String(500), nullable=False)
+    option_b: Mapped[str] = mapped_column(String(500), nullable=False)
+    option_c: Mapped[str] = mapped_column(String(500), nullable=False)
+    option_d: Mapped[str] = mapped_column(String(500), nullable=False)
+    correct_answer: Mapped[str] = mapped_column(String(1), nullable=False)  # A, B, C, or D
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
+    created_by: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.telegram_id"))
     
     # Relationships
     product = relationship("Product", back_populates="test_questions")
+    
+    @property
+    def options(self) -> list:
+        """Answer options in A-D order"""
+        return [self.option_a, self.option_b, self.option_c, self.option_d]
 
 class TestResult(Base):
     __tablename__ = "test_results"
     
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.telegram_id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
-    score = Column(Float, nullable=False)  # Percentage score
-    total_questions = Column(Integer, nullable=False)
-    correct_answers = Column(Integer, nullable=False)
-    completed_at = Column(DateTime, default=datetime.utcnow)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.telegram_id"))
+    product_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("products.id"))
+    score: Mapped[float] = mapped_column(Float, nullable=False)  # Percentage score
+    total_questions: Mapped[int] = mapped_column(Integer, nullable=False)
+    correct_answers: Mapped[int] = mapped_column(Integer, nullable=False)
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    # Latest results of a user are read newest first
+    __table_args__ = (
+        Index("idx_test_results_user_completed", user_id, completed_at.desc()),
+    )
     
     # Relationships
     user = relationship("User", back_populates="test_results")
+    product = relationship("Product")
+
+class TestAnswer(Base):
+    __tablename__ = "test_answers"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.telegram_id"), index=True)
+    product_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("products.id"))
+    question_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("test_questions.id"))
+    answer: Mapped[str] = mapped_column(String(1), nullable=False)  # A, B, C, or D
+    is_correct: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    answered_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
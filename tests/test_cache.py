@@ -0,0 +1,42 @@
+import asyncio
+from utils.cache import async_ttl_cache
+
+def test_concurrent_misses_share_one_call():
+    calls = []
+
+    @async_ttl_cache(ttl=60)
+    async def load(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key * 2
+
+    async def run():
+        return await asyncio.gather(*(load(3) for _ in range(10)))
+
+    assert asyncio.run(run()) == [6] * 10
+    assert calls == [3]
+
+def test_clear_during_load_does_not_store_stale_result():
+    source = {"value": "old"}
+
+    async def run():
+        started = asyncio.Event()
+        gate = asyncio.Event()
+
+        @async_ttl_cache(ttl=60)
+        async def load():
+            value = source["value"]
+            started.set()
+            await gate.wait()
+            return value
+
+        pending = asyncio.create_task(load())
+        await started.wait()
+        # The data changes and the cache is invalidated while the old load is running
+        source["value"] = "new"
+        load.cache_clear()
+        gate.set()
+        assert await pending == "old"
+        return await load()
+
+    assert asyncio.run(run()) == "new"
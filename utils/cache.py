@@ -0,0 +1,62 @@
+import asyncio
+import functools
+import time
+from typing import Any, Callable, Dict, Tuple
+
+def async_ttl_cache(ttl: float, maxsize: int = 128):
+    """Cache results of an async function per arguments for ttl seconds"""
+    def decorator(func: Callable):
+        cache: Dict[Tuple, Tuple[float, Any]] = {}
+        # Loads in progress, so concurrent misses on a key share one call
+        in_flight: Dict[Tuple, asyncio.Task] = {}
+        # Bumped by cache_clear so loads started before it do not store stale results
+        generation = 0
+
+        def make_key(args: Tuple, kwargs: Dict) -> Tuple:
+            return (args, tuple(sorted(kwargs.items())))
+
+        async def load(key: Tuple, args: Tuple, kwargs: Dict):
+            started_generation = generation
+            value = await func(*args, **kwargs)
+            if started_generation != generation:
+                return value
+            now = time.monotonic()
+            if len(cache) >= maxsize:
+                # Drop expired entries first, then the oldest one if still full
+                for stale_key in [k for k, (expires, _) in cache.items() if expires <= now]:
+                    del cache[stale_key]
+                if len(cache) >= maxsize:
+                    del cache[next(iter(cache))]
+            cache[key] = (now + ttl, value)
+            return value
+
+        def forget(key: Tuple, task: asyncio.Task):
+            # A load from before cache_clear must not drop the load that replaced it
+            if in_flight.get(key) is task:
+                del in_flight[key]
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            entry = cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+            task = in_flight.get(key)
+            if task is None:
+                task = asyncio.create_task(load(key, args, kwargs))
+                in_flight[key] = task
+                task.add_done_callback(functools.partial(forget, key))
+            # A cancelled caller must not cancel the load other callers wait on
+            return await asyncio.shield(task)
+
+        def cache_clear():
+            nonlocal generation
+            generation += 1
+            cache.clear()
+            # Later callers start a fresh load instead of joining one from before the clear
+            in_flight.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
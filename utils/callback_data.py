@@ -0,0 +1,13 @@
+from aiogram.filters.callback_data import CallbackData
+
+class SearchResultCallback(CallbackData, prefix="search_result"):
+    """Product selected from search results"""
+    product_id: int
+
+class ViewCategoryCallback(CallbackData, prefix="view_category"):
+    """Category opened in the knowledge base"""
+    category_id: int
+
+class ViewProductCallback(CallbackData, prefix="view_product"):
+    """Product opened in the knowledge base"""
+    product_id: int
@@ -1,6 +1,49 @@
-import re
-from typing import Optional
-from aiogram.types import CallbackQuery, Message
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import suppress
+from functools import lru_cache
+from typing import List, Optional, Set
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+
+logger = logging.getLogger(__name__)
+
+# How a product's attachments were last shown ("photo", "document" or "text"),
+# keyed by its file ids so stale ones are not retried on every view
+_MEDIA_KIND_CACHE_SIZE = 4096
+_media_kinds: "OrderedDict[tuple, str]" = OrderedDict()
+
+# Parts of Telegram errors meaning a stored file id can't be sent as that kind
+_FILE_ID_ERROR_MARKERS = ("wrong file identifier", "file_id", "wrong type")
+
+# Callback answers still in flight; kept referenced until they finish
+_pending_answers: Set[asyncio.Task] = set()
+
+# Characters that must be escaped in MarkdownV2 text
+_MARKDOWN_SPECIAL_CHARS = r'_*[]()~`>#+-=|{}.!'
+_MARKDOWN_ESCAPE_TABLE = str.maketrans({char: '\\' + char for char in _MARKDOWN_SPECIAL_CHARS})
+
+# Accepted correct-answer letters, in either case
+_VALID_ANSWERS = frozenset("ABCDabcd")
+
+# Test result messages (HTML) by score band as (minimum score, template), best first
+_TEST_RESULT_TEMPLATE = (
+    "{emoji} <b>Тест завершен!</b>\n\n"
+    "📊 Результат: %.1f%%\n"
+    "✅ Правильно: %d/%d\n"
+    "📈 Статус: {status}"
+)
+
+_SCORE_BANDS = tuple(
+    (threshold, _TEST_RESULT_TEMPLATE.format(emoji=emoji, status=status))
+    for threshold, emoji, status in (
+        (80, "🎉", "Отлично!"),
+        (60, "👍", "Хорошо!"),
+        (40, "📚", "Продолжайте учиться!"),
+        (float("-inf"), "💪", "Нужно больше практики!"),
+    )
+)
 
 class MessageHelper:
     """Helper class for message handling"""
@@ -13,130 +56,206 @@ class MessageHelper:
         parse_mode: Optional[str] = None
     ):
         """Safely edit message, handling both Message and CallbackQuery"""
+        message = message_or_query.message if isinstance(message_or_query, CallbackQuery) else message_or_query
+        
+        if not message:
+            return
+        
         try:
-            if isinstance(message_or_query, CallbackQuery):
-                if message_or_query.message:
-                    await message_or_query.message.edit_text(
-                        text=text,
-                        reply_markup=reply_markup,
-                        parse_mode=parse_mode
-                    )
-            else:
-                await message_or_query.edit_text(
+            await message.edit_text(
+                text=text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                # Already showing this content
+                if isinstance(message_or_query, CallbackQuery):
+                    await MessageHelper.safe_answer_callback(message_or_query)
+                return
+            # The message can't be edited (e.g. it has media), so send a new one
+            with suppress(TelegramAPIError):
+                await message.answer(
                     text=text,
                     reply_markup=reply_markup,
                     parse_mode=parse_mode
                 )
-        except Exception as e:
-            # If editing fails, try to send a new message
+        except TelegramAPIError as e:
+            # Flood control, network errors and the like; keep handlers running
+            logger.warning("Failed to edit message: %s", e)
+
+    @staticmethod
+    async def render_menu(
+        message_or_query,
+        text: str,
+        rows: List[List[InlineKeyboardButton]],
+        *,
+        edit: bool = True,
+        parse_mode: Optional[str] = None
+    ):
+        """Show a menu built from rows of buttons, editing the current message or sending a new one"""
+        markup = InlineKeyboardMarkup(inline_keyboard=rows)
+        
+        if edit:
+            await MessageHelper.safe_edit_message(
+                message_or_query,
+                text=text,
+                reply_markup=markup,
+                parse_mode=parse_mode
+            )
+        else:
+            await message_or_query.answer(
+                text=text,
+                reply_markup=markup,
+                parse_mode=parse_mode
+            )
+
+    @staticmethod
+    async def send_product(query: CallbackQuery, product, text: str, reply_markup, parse_mode: Optional[str] = None):
+        """Show a product with its image or document, falling back to editing the message as text"""
+        media_key = (product.image_file_id, product.document_file_id)
+        candidates = [
+            kind for kind, file_id in (("photo", product.image_file_id), ("document", product.document_file_id))
+            if file_id
+        ]
+        known_kind = _media_kinds.get(media_key)
+        if known_kind is not None:
+            candidates = [kind for kind in candidates if kind == known_kind]
+        
+        transient_failure = False
+        for kind in candidates:
             try:
-                if isinstance(message_or_query, CallbackQuery):
-                    if message_or_query.message:
-                        await message_or_query.message.answer(
-                            text=text,
-                            reply_markup=reply_markup,
-                            parse_mode=parse_mode
-                        )
+                if kind == "photo":
+                    await query.message.answer_photo(
+                        photo=product.image_file_id,
+                        caption=text,
+                        reply_markup=reply_markup,
+                        parse_mode=parse_mode
+                    )
                 else:
-                    await message_or_query.answer(
-                        text=text,
+                    await query.message.answer_document(
+                        document=product.document_file_id,
+                        caption=text,
                         reply_markup=reply_markup,
                         parse_mode=parse_mode
                     )
-            except Exception:
-                pass  # Fail silently if both attempts fail
+                MessageHelper._remember_media_kind(media_key, kind)
+                await MessageHelper.safe_answer_callback(query)
+                return
+            except TelegramAPIError as e:
+                logger.warning("Failed to send %s: %s", kind, e)
+                # Only a rejected file id is worth remembering; caption errors
+                # (bad entities, too long) can go away once the text is fixed
+                if not MessageHelper._is_file_id_error(e):
+                    transient_failure = True
+        
+        # Send as text message if no files or files failed; only rejected file ids are remembered
+        if candidates and not transient_failure:
+            MessageHelper._remember_media_kind(media_key, "text")
+        await MessageHelper.safe_edit_message(
+            query,
+            text=text,
+            reply_markup=reply_markup,
+            parse_mode=parse_mode
+        )
+
+    @staticmethod
+    def _is_file_id_error(error: TelegramAPIError) -> bool:
+        """Whether Telegram rejected the attachment's file id itself"""
+        if not isinstance(error, TelegramBadRequest):
+            return False
+        message = error.message.lower()
+        return any(marker in message for marker in _FILE_ID_ERROR_MARKERS)
+
+    @staticmethod
+    def _remember_media_kind(media_key: tuple, kind: str):
+        """Record how a product's attachments could be shown"""
+        _media_kinds[media_key] = kind
+        _media_kinds.move_to_end(media_key)
+        if len(_media_kinds) > _MEDIA_KIND_CACHE_SIZE:
+            _media_kinds.popitem(last=False)
 
     @staticmethod
     async def safe_answer_callback(query: CallbackQuery, text: str = "", show_alert: bool = False):
-        """Safely answer callback query"""
-        try:
+        """Safely answer callback query in the background, without waiting for Telegram"""
+        task = asyncio.create_task(MessageHelper._answer_callback(query, text, show_alert))
+        _pending_answers.add(task)
+        task.add_done_callback(_pending_answers.discard)
+
+    @staticmethod
+    async def _answer_callback(query: CallbackQuery, text: str, show_alert: bool):
+        """Answer callback query, ignoring Telegram errors"""
+        # Fail silently if answer fails (e.g. the query is too old)
+        with suppress(TelegramAPIError):
             await query.answer(text=text, show_alert=show_alert)
-        except Exception:
-            pass  # Fail silently if answer fails
 
     @staticmethod
     def format_product_info(product, category_name: str = None) -> str:
         """Format product information for display"""
-        text = f"📦 **{product.name}**\n\n"
-        
-        if category_name:
-            text += f"📁 Категория: {category_name}\n"
-        
-        if product.description:
-            text += f"📄 Описание: {product.description}\n"
-        
-        return text
+        return MessageHelper._format_product_info(product.name, product.description, category_name)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _format_product_info(name: str, description: Optional[str], category_name: Optional[str]) -> str:
+        """Build product information text once per distinct product content"""
+        category_line = f"📁 Категория: {category_name}\n" if category_name else ""
+        description_line = f"📄 Описание: {description}\n" if description else ""
+        return f"📦 **{name}**\n\n{category_line}{description_line}"
 
     @staticmethod
     def format_test_result(score: float, correct: int, total: int) -> str:
-        """Format test result for display"""
-        if score >= 80:
-            emoji = "🎉"
-            status = "Отлично!"
-        elif score >= 60:
-            emoji = "👍"
-            status = "Хорошо!"
-        elif score >= 40:
-            emoji = "📚"
-            status = "Продолжайте учиться!"
-        else:
-            emoji = "💪"
-            status = "Нужно больше практики!"
-        
-        return (
-            f"{emoji} **Тест завершен!**\n\n"
-            f"📊 Результат: {score:.1f}%\n"
-            f"✅ Правильно: {correct}/{total}\n"
-            f"📈 Статус: {status}"
-        )
+        """Format test result for display (HTML)"""
+        template = next(template for threshold, template in _SCORE_BANDS if score >= threshold)
+        return template % (score, correct, total)
 
     @staticmethod
     def escape_markdown(text: str) -> str:
         """Escape markdown special characters"""
-        escape_chars = r'_*[]()~`>#+-=|{}.!'
-        return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', text)
+        return text.translate(_MARKDOWN_ESCAPE_TABLE)
 
 class ValidationHelper:
     """Helper class for input validation"""
     
+    @staticmethod
+    def normalize_input(text: Optional[str]) -> str:
+        """Strip surrounding whitespace, copying the string only when there is any"""
+        if not text:
+            return ""
+        if text[0].isspace() or text[-1].isspace():
+            return text.strip()
+        return text
+    
+    @staticmethod
+    def _length_in(text: Optional[str], minimum: int, maximum: int) -> bool:
+        """Check the length of text without its surrounding whitespace"""
+        return minimum <= len(ValidationHelper.normalize_input(text)) <= maximum
+    
     @staticmethod
     def is_valid_category_name(name: str) -> bool:
         """Validate category name"""
-        if not name:
-            return False
-        return 2 <= len(name.strip()) <= 100
+        return ValidationHelper._length_in(name, 2, 100)
     
     @staticmethod
     def is_valid_product_name(name: str) -> bool:
         """Validate product name"""
-        if not name:
-            return False
-        return 2 <= len(name.strip()) <= 255
+        return ValidationHelper._length_in(name, 2, 255)
     
     @staticmethod
     def is_valid_description(description: str) -> bool:
         """Validate description"""
-        if not description:
-            return True
-        return len(description.strip()) <= 2000
+        return ValidationHelper._length_in(description, 0, 2000)
     
     @staticmethod
     def is_valid_question(question: str) -> bool:
         """Validate test question"""
-        if not question:
-            return False
-        return 10 <= len(question.strip()) <= 1000
+        return ValidationHelper._length_in(question, 10, 1000)
     
     @staticmethod
     def is_valid_option(option: str) -> bool:
         """Validate test option"""
-        if not option:
-            return False
-        return 1 <= len(option.strip()) <= 500
+        return ValidationHelper._length_in(option, 1, 500)
     
     @staticmethod
     def is_valid_answer(answer: str) -> bool:
         """Validate correct answer"""
-        if not answer:
-            return False
-        return answer.upper() in ['A', 'B', 'C', 'D']
+        return answer in _VALID_ANSWERS
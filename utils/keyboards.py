@@ -1,114 +1,126 @@
-from typing import List
+from functools import lru_cache
+from typing import Final, List, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from utils.callback_data import ViewCategoryCallback
+
+# Static buttons shared across keyboards
+_BACK_TO_MAIN_MENU_BUTTON: Final = InlineKeyboardButton(
+    text="🔙 В главное меню",
+    callback_data="main_menu"
+)
+
+_MAIN_MENU_BUTTON: Final = InlineKeyboardButton(
+    text="🏠 Главное меню",
+    callback_data="main_menu"
+)
+
+_SEARCH_AGAIN_BUTTON: Final = InlineKeyboardButton(
+    text="🔍 Искать снова",
+    callback_data="search_products"
+)
+
+_BACK_TO_CATEGORIES_BUTTON: Final = InlineKeyboardButton(
+    text="🔙 К категориям",
+    callback_data="knowledge_base"
+)
+
+_BACK_TO_ADMIN_CATEGORIES_BUTTON: Final = InlineKeyboardButton(
+    text="🔙 К категориям",
+    callback_data="admin_categories"
+)
+
+_BACK_TO_ADMIN_PRODUCTS_BUTTON: Final = InlineKeyboardButton(
+    text="🔙 К продуктам",
+    callback_data="admin_products"
+)
+
+_CANCEL_BUTTON: Final = InlineKeyboardButton(
+    text="❌ Отмена",
+    callback_data="cancel"
+)
+
+# Admin edit/delete button templates; the entity keyboards fill in the callback data
+_EDIT_BUTTON: Final = InlineKeyboardButton(
+    text="✏️ Редактировать",
+    callback_data="edit"
+)
+
+_DELETE_BUTTON: Final = InlineKeyboardButton(
+    text="🗑️ Удалить",
+    callback_data="delete"
+)
+
+# Answer option buttons; test_question fills in the callback data per question
+_ANSWER_OPTION_BUTTONS: Final = tuple(
+    (option, InlineKeyboardButton(text=f"🔘 {option}", callback_data=option))
+    for option in ('A', 'B', 'C', 'D')
+)
+
+@lru_cache(maxsize=256)
+def _progress_button(current_question: int, total_questions: int) -> InlineKeyboardButton:
+    """Non-clickable progress button, shared by all tests at the same position"""
+    return InlineKeyboardButton(
+        text=f"📊 Вопрос {current_question}/{total_questions}",
+        callback_data="noop"
+    )
 
 class Keyboards:
     """Utility class for creating inline keyboards"""
     
     @staticmethod
+    @lru_cache(maxsize=4)
     def main_menu(is_admin: bool = False) -> InlineKeyboardMarkup:
         """Main menu keyboard"""
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="📚 База знаний",
-                callback_data="knowledge_base"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="🔍 Поиск продуктов",
-                callback_data="search_products"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="📝 Пройти тест",
-                callback_data="take_test"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="📊 Мои результаты",
-                callback_data="my_results"
-            )
-        )
+        rows = [
+            [InlineKeyboardButton(text="📚 База знаний", callback_data="knowledge_base")],
+            [InlineKeyboardButton(text="🔍 Поиск продуктов", callback_data="search_products")],
+            [InlineKeyboardButton(text="📝 Пройти тест", callback_data="take_test")],
+            [InlineKeyboardButton(text="📊 Мои результаты", callback_data="my_results")]
+        ]
         
         if is_admin:
-            builder.row(
-                InlineKeyboardButton(
-                    text="⚙️ Панель администратора",
-                    callback_data="admin_panel"
-                )
-            )
+            rows.append([InlineKeyboardButton(text="⚙️ Панель администратора", callback_data="admin_panel")])
         
-        return builder.as_markup()
+        return InlineKeyboardMarkup(inline_keyboard=rows)
     
     @staticmethod
+    @lru_cache(maxsize=1)
     def admin_panel() -> InlineKeyboardMarkup:
         """Admin panel keyboard"""
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="📁 Управление категориями",
-                callback_data="admin_categories"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="📦 Управление продуктами",
-                callback_data="admin_products"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="❓ Управление тестами",
-                callback_data="admin_questions"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="📊 Статистика",
-                callback_data="admin_stats"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="🔙 В главное меню",
-                callback_data="main_menu"
-            )
-        )
-        
-        return builder.as_markup()
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📁 Управление категориями", callback_data="admin_categories")],
+            [InlineKeyboardButton(text="📦 Управление продуктами", callback_data="admin_products")],
+            [InlineKeyboardButton(text="❓ Управление тестами", callback_data="admin_questions")],
+            [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
+            [_BACK_TO_MAIN_MENU_BUTTON]
+        ])
     
     @staticmethod
     def categories_list(categories: List, action_prefix: str = "view_category") -> InlineKeyboardMarkup:
         """Categories list keyboard"""
+        return Keyboards._categories_markup(
+            tuple((category.id, category.name) for category in categories),
+            action_prefix
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _categories_markup(categories: Tuple[Tuple[int, str], ...], action_prefix: str) -> InlineKeyboardMarkup:
+        """Build categories list keyboard once per distinct category list"""
         builder = InlineKeyboardBuilder()
+        prefix = f"{action_prefix}:"
         
-        for category in categories:
-            builder.row(
-                InlineKeyboardButton(
-                    text=f"📁 {category.name}",
-                    callback_data=f"{action_prefix}:{category.id}"
-                )
-            )
-        
-        builder.row(
+        builder.add(*(
             InlineKeyboardButton(
-                text="🔙 В главное меню",
-                callback_data="main_menu"
+                text=f"📁 {name}",
+                callback_data=prefix + str(category_id)
             )
-        )
+            for category_id, name in categories
+        ))
+        builder.adjust(1)
+        
+        builder.row(_BACK_TO_MAIN_MENU_BUTTON)
         
         return builder.as_markup()
     
@@ -116,20 +128,24 @@ class Keyboards:
     def products_list(products: List, action_prefix: str = "view_product") -> InlineKeyboardMarkup:
         """Products list keyboard"""
         builder = InlineKeyboardBuilder()
+        prefix = f"{action_prefix}:"
         
-        for product in products:
-            builder.row(
-                InlineKeyboardButton(
-                    text=f"📦 {product.name}",
-                    callback_data=f"{action_prefix}:{product.id}"
-                )
+        builder.add(*(
+            InlineKeyboardButton(
+                text=f"📦 {product.name}",
+                callback_data=prefix + str(product.id)
             )
+            for product in products
+        ))
+        builder.adjust(1)
         
         return builder.as_markup()
     
     @staticmethod
-    def product_actions(product_id: int, has_test: bool = False, category_id: int = None) -> InlineKeyboardMarkup:
-        """Product actions keyboard"""
+    @lru_cache(maxsize=2048)
+    def product_actions(product_id: int, has_test: bool = False, category_id: int = None,
+                        footer: str = "category") -> InlineKeyboardMarkup:
+        """Product actions keyboard, with navigation back to the category or to search"""
         builder = InlineKeyboardBuilder()
         
         if has_test:
@@ -140,98 +156,60 @@ class Keyboards:
                 )
             )
         
-        if category_id:
+        if footer == "search":
+            builder.row(_SEARCH_AGAIN_BUTTON)
+            builder.row(_MAIN_MENU_BUTTON)
+        elif category_id:
             builder.row(
                 InlineKeyboardButton(
                     text="🔙 К продуктам",
-                    callback_data=f"view_category:{category_id}"
+                    callback_data=ViewCategoryCallback(category_id=category_id).pack()
                 )
             )
         else:
-            builder.row(
-                InlineKeyboardButton(
-                    text="🔙 К категориям",
-                    callback_data="knowledge_base"
-                )
-            )
+            builder.row(_BACK_TO_CATEGORIES_BUTTON)
         
         return builder.as_markup()
     
     @staticmethod
+    @lru_cache(maxsize=1024)
     def test_question(question_id: int, current_question: int, total_questions: int) -> InlineKeyboardMarkup:
         """Test question keyboard"""
         builder = InlineKeyboardBuilder()
+        prefix = f"answer:{question_id}:"
         
-        # Answer options
-        for option in ['A', 'B', 'C', 'D']:
-            builder.row(
-                InlineKeyboardButton(
-                    text=f"🔘 {option}",
-                    callback_data=f"answer:{question_id}:{option}"
-                )
-            )
+        # Answer options, copied from the templates with this question's callback data
+        for option, button in _ANSWER_OPTION_BUTTONS:
+            builder.row(button.model_copy(update={"callback_data": prefix + option}))
         
         # Progress info (non-clickable)
-        builder.row(
-            InlineKeyboardButton(
-                text=f"📊 Вопрос {current_question}/{total_questions}",
-                callback_data="noop"
-            )
-        )
+        builder.row(_progress_button(current_question, total_questions))
         
         return builder.as_markup()
     
     @staticmethod
     def admin_category_actions(category_id: int) -> InlineKeyboardMarkup:
         """Admin category actions keyboard"""
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="✏️ Редактировать",
-                callback_data=f"edit_category:{category_id}"
-            ),
-            InlineKeyboardButton(
-                text="🗑️ Удалить",
-                callback_data=f"delete_category:{category_id}"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="🔙 К категориям",
-                callback_data="admin_categories"
-            )
-        )
-        
-        return builder.as_markup()
+        return Keyboards._entity_actions("category", category_id, _BACK_TO_ADMIN_CATEGORIES_BUTTON)
     
     @staticmethod
     def admin_product_actions(product_id: int) -> InlineKeyboardMarkup:
         """Admin product actions keyboard"""
-        builder = InlineKeyboardBuilder()
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="✏️ Редактировать",
-                callback_data=f"edit_product:{product_id}"
-            ),
-            InlineKeyboardButton(
-                text="🗑️ Удалить",
-                callback_data=f"delete_product:{product_id}"
-            )
-        )
-        
-        builder.row(
-            InlineKeyboardButton(
-                text="🔙 К продуктам",
-                callback_data="admin_products"
-            )
-        )
-        
-        return builder.as_markup()
+        return Keyboards._entity_actions("product", product_id, _BACK_TO_ADMIN_PRODUCTS_BUTTON)
     
     @staticmethod
+    def _entity_actions(entity: str, entity_id: int, back_button: InlineKeyboardButton) -> InlineKeyboardMarkup:
+        """Edit/delete keyboard for an admin entity, copied from the button templates"""
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [
+                _EDIT_BUTTON.model_copy(update={"callback_data": f"edit_{entity}:{entity_id}"}),
+                _DELETE_BUTTON.model_copy(update={"callback_data": f"delete_{entity}:{entity_id}"})
+            ],
+            [back_button]
+        ])
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
     def confirm_action(action_data: str) -> InlineKeyboardMarkup:
         """Confirmation keyboard"""
         builder = InlineKeyboardBuilder()
@@ -241,10 +219,7 @@ class Keyboards:
                 text="✅ Подтвердить",
                 callback_data=f"confirm:{action_data}"
             ),
-            InlineKeyboardButton(
-                text="❌ Отмена",
-                callback_data="cancel"
-            )
+            _CANCEL_BUTTON
         )
         
         return builder.as_markup()
@@ -0,0 +1,120 @@
+from typing import Any, Dict, List, Optional
+import orjson
+from database import redis_client
+
+# Test sessions expire if a user abandons a test. A session only holds the
+# question ids and the correct answer letters ("answer_key", one per question);
+# question texts come from the questions cache.
+SESSION_TTL = 3600  # seconds
+
+# Advance the session only if it is still on the question that was answered,
+# so a double tap cannot skip a question. Returns the new question index.
+_RECORD_ANSWER_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'current_question'))
+if current == nil or current ~= tonumber(ARGV[1]) then
+    return nil
+end
+redis.call('HSET', KEYS[1], 'current_question', current + 1, 'answer:' .. ARGV[2], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return current + 1
+"""
+
+class MemoryTestSessionStore:
+    """Test sessions kept in process memory (local development)"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    async def create(self, session_key: str, user_id: int, product_id: int, question_ids: List[int], answer_key: str):
+        """Start a new test session"""
+        self._sessions[session_key] = {
+            'user_id': user_id,
+            'product_id': product_id,
+            'question_ids': question_ids,
+            'answer_key': answer_key,
+            'current_question': 0,
+            'answers': {}
+        }
+
+    async def get(self, session_key: str) -> Optional[Dict[str, Any]]:
+        """Get test session data"""
+        return self._sessions.get(session_key)
+
+    async def record_answer(self, session_key: str, expected_index: int, question_id: int,
+                            answer: str, is_correct: bool) -> bool:
+        """Store an answer and move to the next question"""
+        session = self._sessions.get(session_key)
+        if not session or session['current_question'] != expected_index:
+            return False
+
+        session['answers'][question_id] = {'answer': answer, 'correct': is_correct}
+        session['current_question'] += 1
+        return True
+
+    async def delete(self, session_key: str):
+        """Remove test session"""
+        self._sessions.pop(session_key, None)
+
+class RedisTestSessionStore:
+    """Test sessions kept in a Redis hash, shared between workers"""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._record_answer = redis.register_script(_RECORD_ANSWER_SCRIPT)
+
+    @staticmethod
+    def _key(session_key: str) -> str:
+        return f"test:{session_key}"
+
+    async def create(self, session_key: str, user_id: int, product_id: int, question_ids: List[int], answer_key: str):
+        """Start a new test session"""
+        key = self._key(session_key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={
+                'user_id': user_id,
+                'product_id': product_id,
+                'question_ids': orjson.dumps(question_ids),
+                'answer_key': answer_key,
+                'current_question': 0
+            })
+            pipe.expire(key, SESSION_TTL)
+            await pipe.execute()
+
+    async def get(self, session_key: str) -> Optional[Dict[str, Any]]:
+        """Get test session data"""
+        data = await self._redis.hgetall(self._key(session_key))
+        if not data:
+            return None
+
+        answers = {}
+        for field, value in data.items():
+            if field.startswith('answer:'):
+                answer, _, correct = value.partition(':')
+                answers[int(field[7:])] = {'answer': answer, 'correct': correct == '1'}
+
+        return {
+            'user_id': int(data['user_id']),
+            'product_id': int(data['product_id']),
+            'question_ids': orjson.loads(data['question_ids']),
+            'answer_key': data['answer_key'],
+            'current_question': int(data['current_question']),
+            'answers': answers
+        }
+
+    async def record_answer(self, session_key: str, expected_index: int, question_id: int,
+                            answer: str, is_correct: bool) -> bool:
+        """Store an answer and move to the next question"""
+        flag = '1' if is_correct else '0'
+        result = await self._record_answer(
+            keys=[self._key(session_key)],
+            args=[expected_index, question_id, f"{answer}:{flag}", SESSION_TTL]
+        )
+        return result is not None
+
+    async def delete(self, session_key: str):
+        """Remove test session"""
+        await self._redis.delete(self._key(session_key))
+
+# Store test sessions in Redis when configured, otherwise in memory
+test_sessions = RedisTestSessionStore(redis_client) if redis_client else MemoryTestSessionStore()